@@ -0,0 +1,436 @@
+import argparse
+import asyncio
+import contextlib
+import csv
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import banking_core
+
+
+def _contention_worker(db_path: str, phone_numbers: list, operations: int, seed: int) -> dict:
+    banking_core.db_pool.path = db_path
+    with contextlib.redirect_stdout(io.StringIO()):
+        controller = banking_core.MobileBankingSystemController(banking_core.MobileBankingSystem())
+        accounts = [banking_core.build_account(*banking_core.get_account_from_db(phone_number))
+                    for phone_number in phone_numbers]
+        for i in range(operations):
+            account = accounts[(seed + i) % len(accounts)]
+            controller.apply_update(account, _add_one)
+    return {'operations': operations, 'retries': controller.update_retries, 'conflicts': controller.update_conflicts}
+
+
+def _add_one(account) -> None:
+    account.balance += 1
+
+
+def run_contention(processes: int, hot_accounts: int, operations: int, db_path: str) -> dict:
+    # every process hammers the same few rows through the compare-and-swap path
+    banking_core.db_pool.path = db_path
+    banking_core.initialize_database()
+    phone_numbers = [f"hot{i:04d}" for i in range(hot_accounts)]
+    for phone_number in phone_numbers:
+        if banking_core.get_account_from_db(phone_number) is None:
+            banking_core.create_account_in_db(phone_number, 0, '', 'mobile')
+    before = sum(banking_core.get_account_from_db(p)[1] for p in phone_numbers)
+
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(processes) as pool:
+        start = time.perf_counter()
+        results = pool.starmap(_contention_worker, [(db_path, phone_numbers, operations, seed)
+                                                    for seed in range(processes)])
+        elapsed = time.perf_counter() - start
+
+    total = sum(r['operations'] for r in results)
+    conflicts = sum(r['conflicts'] for r in results)
+    after = sum(banking_core.get_account_from_db(p)[1] for p in phone_numbers)
+    return {
+        'processes': processes,
+        'hot_accounts': hot_accounts,
+        'operations': total,
+        'seconds': round(elapsed, 3),
+        'ops_per_second': round(total / elapsed, 1),
+        'retries': sum(r['retries'] for r in results),
+        'conflicts': conflicts,
+        'lost_updates': int(total - conflicts - (after - before)),
+    }
+
+
+def contention_command(args) -> None:
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = args.db or os.path.join(directory, 'contention.db')
+        for processes in args.processes:
+            result = run_contention(processes, args.hot_accounts, args.operations, db_path)
+            print(f"{processes:>3} writers: {result['ops_per_second']:>9.1f} ops/s, "
+                  f"{result['retries']} retries, {result['conflicts']} gave up, {result['lost_updates']} lost updates")
+            results.append(result)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+def _shard_worker(db_path: str, phone_numbers: tuple, operations: int) -> int:
+    banking_core.db_pool.path = db_path
+    banking_core.initialize_database()
+    for i in range(operations):
+        source, target = phone_numbers if i % 2 == 0 else phone_numbers[::-1]
+        banking_core.transfer_funds_in_db(source, target, 1)
+    return operations
+
+
+def _accounts_in_shard(shard: int, prefix: str, count: int) -> list:
+    phone_numbers = (f"{prefix}{i:06d}" for i in range(10 ** 6))
+    return [p for p in phone_numbers if banking_core.db_pool.shard_of(p) == shard][:count]
+
+
+def run_shards(shards: int, writers: int, operations: int, db_path: str) -> dict:
+    # every writer process moves money between two accounts of its own shard, one transaction per transfer,
+    # so the only thing writers contend on is the write lock of a shard they share
+    banking_core.db_pool.close_all()
+    banking_core.db_pool.path = db_path
+    banking_core.initialize_database(shards)
+    pairs = []
+    for writer in range(writers):
+        pair = tuple(_accounts_in_shard(writer % shards, f"w{writer:03d}", 2))
+        for phone_number in pair:
+            banking_core.create_account_in_db(phone_number, operations, '', 'mobile')
+        pairs.append(pair)
+
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(writers) as pool:
+        start = time.perf_counter()
+        total = sum(pool.starmap(_shard_worker, [(db_path, pair, operations) for pair in pairs]))
+        elapsed = time.perf_counter() - start
+    return {
+        'shards': shards,
+        'writers': writers,
+        'operations': total,
+        'seconds': round(elapsed, 3),
+        'ops_per_second': round(total / elapsed, 1),
+    }
+
+
+def shards_command(args) -> None:
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for shards in args.shards:
+            result = run_shards(shards, args.writers or max(args.shards), args.operations,
+                                os.path.join(directory, f'shards{shards}.db'))
+            print(f"{shards:>3} shards, {result['writers']} writers: {result['ops_per_second']:>9.1f} transfers/s")
+            results.append(result)
+    print(f"(scaling needs at least as many free cores as writers; this machine has {os.cpu_count()})")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+DEFAULT_MIX = 'create=1,login=2,deposit=40,withdraw=30,transfer=27'
+SYNTHETIC_PIN = '0000'
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+def generate_population(path: str, accounts: int, seed: int = 0) -> None:
+    # one scrypt hash shared by every synthetic row; hashing millions of PINs would dominate the setup
+    rng = random.Random(seed)
+    pin_hash = banking_core.hash_pin(SYNTHETIC_PIN)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(banking_core.ACCOUNT_COLUMNS)
+        for i in range(accounts):
+            account_type = banking_core.ACCOUNT_TYPES[i % len(banking_core.ACCOUNT_TYPES)]
+            writer.writerow((f"019{i:08d}", round(rng.uniform(0, 10000), 2), pin_hash, account_type,
+                             0.05 if account_type == 'savings' else '',
+                             round(rng.uniform(1000, 50000), 2) if account_type == 'loan' else '',
+                             f"POL{i:08d}" if account_type == 'insurance' else '', f"Customer {i}"))
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def summarize(latencies: list, elapsed: float = None) -> dict:
+    # without a wall-clock elapsed time, throughput is per unit of time spent in this operation
+    elapsed = sum(latencies) if elapsed is None else elapsed
+    latencies.sort()
+    return {
+        'count': len(latencies),
+        'ops_per_second': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def run_suite(accounts: int, operations: int, mix: dict, db_path: str, seed: int = 0, clients: int = 1) -> dict:
+    banking_core.db_pool.path = db_path
+    rng = random.Random(seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        system = banking_core.MobileBankingSystem()
+        controller = banking_core.MobileBankingSystemController(system)
+        population_path = db_path + '.population.csv'
+        generate_population(population_path, accounts, seed)
+        start = time.perf_counter()
+        banking_core.import_accounts(population_path)
+        populate_seconds = time.perf_counter() - start
+        os.remove(population_path)
+
+        phone_numbers = [f"019{i:08d}" for i in range(accounts)]
+        sessions = {}
+
+        def session(phone_number):
+            account = sessions.get(phone_number)
+            if account is None:
+                account_data = banking_core.get_account_from_db(phone_number)
+                account = sessions[phone_number] = banking_core.build_account(*account_data)
+            return account
+
+        operations_by_name = {
+            'create': lambda: controller.create_account(f"018{rng.getrandbits(40):013d}", SYNTHETIC_PIN, 'mobile'),
+            'login': lambda: controller.login(rng.choice(phone_numbers), SYNTHETIC_PIN),
+            'deposit': lambda: controller.deposit(session(rng.choice(phone_numbers)), round(rng.uniform(1, 500), 2)),
+            'withdraw': lambda: controller.withdraw(session(rng.choice(phone_numbers)), round(rng.uniform(1, 500), 2)),
+            'transfer': lambda: controller.transfer(session(rng.choice(phone_numbers)),
+                                                    controller.find_account(rng.choice(phone_numbers)),
+                                                    round(rng.uniform(1, 500), 2)),
+        }
+        names = [name for name in mix if name in operations_by_name]
+        choices = rng.choices(names, weights=[mix[name] for name in names], k=operations)
+        latencies = {name: [] for name in names}
+        timer = time.perf_counter
+
+        def client(client_choices):
+            for name in client_choices:
+                began = timer()
+                result = operations_by_name[name]()
+                if isinstance(result, Future):
+                    result.result()
+                latencies[name].append(timer() - began)
+
+        start = timer()
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            list(executor.map(client, [choices[i::clients] for i in range(clients)]))
+        elapsed = timer() - start
+        controller.ledger_writer.close()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'accounts': accounts,
+        'clients': clients,
+        'populate_seconds': round(populate_seconds, 3),
+        'mix': mix,
+        'overall': summarize(all_latencies, elapsed),
+        'operations': {name: summarize(values) for name, values in latencies.items() if values},
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for name, current in result['operations'].items():
+        previous = baseline.get('operations', {}).get(name)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+        if current['ops_per_second'] < previous['ops_per_second'] * (1 - tolerance):
+            regressions.append(f"{name}: {previous['ops_per_second']} -> {current['ops_per_second']} ops/s")
+    return regressions
+
+
+def print_operations(result: dict) -> None:
+    print(f"{'operation':<10}{'count':>8}{'ops/s':>11}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in list(result['operations'].items()) + [('overall', result['overall'])]:
+        print(f"{name:<10}{stats['count']:>8}{stats['ops_per_second']:>11.1f}"
+              f"{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}{stats['p99_ms']:>10.3f}")
+
+
+def suite_command(args) -> None:
+    banking_core.metrics.enabled = bool(args.metrics)
+    with tempfile.TemporaryDirectory() as directory:
+        result = run_suite(args.accounts, args.operations, parse_mix(args.mix),
+                           args.db or os.path.join(directory, 'suite.db'), args.seed, args.clients)
+    print(f"{result['accounts']} accounts populated in {result['populate_seconds']}s")
+    print_operations(result)
+    if args.metrics:
+        banking_core.metrics.dump(args.metrics)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            raise SystemExit(1)
+
+
+SERVICE_MIX = 'deposit=35,withdraw=25,transfer=25,balance=15'
+
+
+async def _drive_service(service, phone_numbers: list, sessions: int, clients: int, operations: int, mix: dict,
+                         seed: int) -> tuple:
+    # a few logged-in sessions shared by many connections, the way a gateway multiplexes its terminals
+    rng = random.Random(seed)
+    login_client = banking_core.RpcClient(port=service.port)
+    await login_client.connect()
+    tokens = [(await login_client.call('login', phone_number=phone_number, pin=SYNTHETIC_PIN))['token']
+              for phone_number in rng.sample(phone_numbers, min(sessions, len(phone_numbers)))]
+    await login_client.close()
+
+    names = [name for name in mix if name in ('deposit', 'withdraw', 'transfer', 'balance')]
+    choices = rng.choices(names, weights=[mix[name] for name in names], k=operations)
+    latencies = {name: [] for name in names}
+    rejected = 0
+    timer = time.perf_counter
+
+    async def client(index: int, client_choices: list) -> None:
+        nonlocal rejected
+        client_rng = random.Random(seed + index)
+        connection = banking_core.RpcClient(port=service.port)
+        await connection.connect()
+        try:
+            for name in client_choices:
+                params = {'token': client_rng.choice(tokens)}
+                if name != 'balance':
+                    params['amount'] = round(client_rng.uniform(1, 500), 2)
+                if name == 'transfer':
+                    params['target_phone_number'] = client_rng.choice(phone_numbers)
+                began = timer()
+                try:
+                    await connection.call(name, **params)
+                except banking_core.RpcError:
+                    # insufficient funds and the like are answers too; they still count towards latency
+                    rejected += 1
+                latencies[name].append(timer() - began)
+        finally:
+            await connection.close()
+
+    start = timer()
+    await asyncio.gather(*(client(i, choices[i::clients]) for i in range(clients)))
+    return latencies, timer() - start, rejected
+
+
+def run_service(accounts: int, operations: int, mix: dict, db_path: str, seed: int = 0, clients: int = 1000,
+                sessions: int = 50, workers: int = 16) -> dict:
+    banking_core.db_pool.path = db_path
+    with contextlib.redirect_stdout(io.StringIO()):
+        # a handful of hot sessions would trip the velocity limits within a second; measure the service instead
+        controller = banking_core.MobileBankingSystemController(banking_core.MobileBankingSystem(),
+                                                             velocity_limits={})
+        population_path = db_path + '.population.csv'
+        generate_population(population_path, accounts, seed)
+        banking_core.import_accounts(population_path)
+        os.remove(population_path)
+        phone_numbers = [f"019{i:08d}" for i in range(accounts)]
+
+        async def main():
+            service = banking_core.BankingService(controller, max_workers=workers)
+            await service.start(port=0)
+            try:
+                return await _drive_service(service, phone_numbers, sessions, clients, operations, mix, seed)
+            finally:
+                await service.close()
+
+        latencies, elapsed, rejected = asyncio.run(main())
+        controller.ledger_writer.close()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'accounts': accounts,
+        'clients': clients,
+        'sessions': sessions,
+        'workers': workers,
+        'rejected': rejected,
+        'mix': mix,
+        'overall': summarize(all_latencies, elapsed),
+        'operations': {name: summarize(values) for name, values in latencies.items() if values},
+    }
+
+
+def service_command(args) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        result = run_service(args.accounts, args.operations, parse_mix(args.mix),
+                             args.db or os.path.join(directory, 'service.db'), args.seed, args.clients,
+                             args.sessions, args.workers)
+    print(f"{result['clients']} connections over {result['sessions']} sessions, "
+          f"{result['rejected']} requests rejected by the bank")
+    print_operations(result)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Headless benchmarks for the mobile banking stack.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    contention_parser = commands.add_parser('contention', help="optimistic-concurrency updates from many processes")
+    contention_parser.add_argument('--processes', type=int, nargs='+', default=[8, 16, 32])
+    contention_parser.add_argument('--hot-accounts', type=int, default=4)
+    contention_parser.add_argument('--operations', type=int, default=500, help="updates per process")
+    contention_parser.add_argument('--db', help="database file (default: a temporary file)")
+    contention_parser.add_argument('--output', help="write results as JSON")
+    contention_parser.set_defaults(handler=contention_command)
+
+    shards_parser = commands.add_parser('shards', help="write throughput as the same writers spread over more shards")
+    shards_parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4])
+    shards_parser.add_argument('--writers', type=int, help="writer processes (default: the largest shard count)")
+    shards_parser.add_argument('--operations', type=int, default=2000, help="transfers per writer")
+    shards_parser.add_argument('--output', help="write results as JSON")
+    shards_parser.set_defaults(handler=shards_command)
+
+    suite_parser = commands.add_parser('suite', help="replay an operation mix against a synthetic population")
+    suite_parser.add_argument('--accounts', type=int, default=100000)
+    suite_parser.add_argument('--operations', type=int, default=20000)
+    suite_parser.add_argument('--mix', default=DEFAULT_MIX, help="weights, default: %(default)s")
+    suite_parser.add_argument('--clients', type=int, default=1, help="concurrent client threads")
+    suite_parser.add_argument('--seed', type=int, default=0)
+    suite_parser.add_argument('--db', help="database file (default: a temporary file)")
+    suite_parser.add_argument('--output', help="write results as JSON")
+    suite_parser.add_argument('--metrics', help="enable instrumentation and write its histograms here")
+    suite_parser.add_argument('--baseline', help="JSON from an earlier run; exit 1 on regressions")
+    suite_parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown (default: %(default)s)")
+    suite_parser.set_defaults(handler=suite_command)
+
+    service_parser = commands.add_parser('service', help="load-test the JSON-RPC service over localhost connections")
+    service_parser.add_argument('--accounts', type=int, default=10000)
+    service_parser.add_argument('--operations', type=int, default=20000)
+    service_parser.add_argument('--mix', default=SERVICE_MIX, help="weights, default: %(default)s")
+    service_parser.add_argument('--clients', type=int, default=1000, help="concurrent connections")
+    service_parser.add_argument('--sessions', type=int, default=50, help="logged-in accounts shared by the clients")
+    service_parser.add_argument('--workers', type=int, default=16, help="service executor threads")
+    service_parser.add_argument('--seed', type=int, default=0)
+    service_parser.add_argument('--db', help="database file (default: a temporary file)")
+    service_parser.add_argument('--output', help="write results as JSON")
+    service_parser.set_defaults(handler=service_command)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import asyncio
+import contextlib
+import os
+
+import banking_core
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="JSON-RPC over HTTP front-end for the mobile banking system.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--db', default=banking_core.DB_PATH, help="database file (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=16, help="threads for database and PIN work")
+    parser.add_argument('--max-pending', type=int, default=1024, help="calls allowed to queue for a worker")
+    parser.add_argument('--verbose', action='store_true', help="keep the per-operation console output")
+    parser.add_argument('--metrics', help="periodically write latency histograms here (.json, else Prometheus text)")
+    parser.add_argument('--metrics-interval', type=float, default=10.0, help="seconds between metrics dumps")
+    parser.add_argument('--snapshot', help="warm-start from this account snapshot and keep rewriting it")
+    parser.add_argument('--snapshot-interval', type=float, default=300.0, help="seconds between snapshots")
+    parser.add_argument('--cache-size', type=int, default=banking_core.account_cache.max_size,
+                        help="accounts kept in memory (default: %(default)s)")
+    parser.add_argument('--registration-fp-rate', type=float, default=0.01,
+                        help="false-positive rate of the registered-number filter (default: %(default)s)")
+    args = parser.parse_args()
+
+    banking_core.db_pool.path = args.db
+    banking_core.account_cache.max_size = args.cache_size
+    system = banking_core.MobileBankingSystem(snapshot_path=args.snapshot,
+                                              registration_false_positive_rate=args.registration_fp_rate)
+    registered = system.registered.stats()
+    print(f"Registration filter: {registered['items']} numbers in {registered['memory_bytes'] / 1024:.0f} KiB, "
+          f"{registered['hashes']} hashes, {registered['expected_false_positive_rate'] * 100:.2g}% false positives "
+          f"(target {registered['target_false_positive_rate']:.2%})")
+    if system.warm_start is not None:
+        print(f"Warm start: {system.warm_start['accounts']} accounts from a snapshot "
+              f"{system.warm_start['age']:.0f}s old, {system.warm_start['replayed']} ledger rows replayed, "
+              f"{system.warm_start['seconds']:.2f}s")
+    controller = banking_core.MobileBankingSystemController(system)
+    service = banking_core.BankingService(controller, args.workers, args.max_pending)
+    print(f"Serving JSON-RPC on http://{args.host}:{args.port}/ ({', '.join(service.methods)})")
+    with contextlib.ExitStack() as stack:
+        if args.snapshot:
+            writer = banking_core.SnapshotWriter(banking_core.account_cache, args.snapshot, args.snapshot_interval)
+            stack.callback(writer.start().stop)
+        if args.metrics:
+            dumper = banking_core.MetricsDumper(banking_core.metrics, args.metrics, args.metrics_interval).start()
+            stack.callback(dumper.stop)
+        if not args.verbose:
+            devnull = stack.enter_context(open(os.devnull, 'w'))
+            stack.enter_context(contextlib.redirect_stdout(devnull))
+        try:
+            asyncio.run(service.serve_forever(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import argparse
+import math
+import time
+
+import banking_core
+
+
+def import_command(args) -> None:
+    start = time.perf_counter()
+    result = banking_core.import_accounts(args.path, args.chunk_size)
+    elapsed = time.perf_counter() - start
+    print(f"Imported {result['imported']} accounts in {elapsed:.2f}s "
+          f"({result['imported'] / elapsed if elapsed else 0:.0f} rows/s), {len(result['rejected'])} rejected.")
+    for line_number, phone_number, reason in result['rejected'][:args.show_rejects]:
+        print(f"  line {line_number}: {phone_number}: {reason}")
+
+
+def export_command(args) -> None:
+    start = time.perf_counter()
+    exported = banking_core.export_accounts(args.path)
+    print(f"Exported {exported} accounts in {time.perf_counter() - start:.2f}s.")
+
+
+def accrue_command(args) -> None:
+    start = time.perf_counter()
+    result = banking_core.accrue_interest(args.periods_per_year, args.dry_run, args.date)
+    action = "Would credit" if result['dry_run'] else "Credited"
+    print(f"{action} {result['total_interest']} Tk/= interest for {result['date']} to {result['accounts']} savings "
+          f"accounts in {time.perf_counter() - start:.2f}s.")
+    if result['skipped_shards']:
+        print(f"{result['skipped_shards']} shard(s) had already accrued {result['date']} and were skipped.")
+
+
+def loans_command(args) -> None:
+    start = time.perf_counter()
+    portfolio = banking_core.LoanPortfolio.from_db()
+    loaded = time.perf_counter()
+    due = portfolio.next_due()
+    arrears = portfolio.arrears()
+    behind = sum(1 for value in arrears if value > 0.005)
+    print(f"{len(portfolio)} loans loaded in {loaded - start:.2f}s; next installments computed in "
+          f"{time.perf_counter() - loaded:.2f}s.")
+    print(f"Due next month: {math.fsum(due):.2f} Tk/=, {behind} loans in arrears ({math.fsum(arrears):.2f} Tk/=).")
+    if args.schedule:
+        index = portfolio.phone_numbers.index(args.schedule)
+        print(f"{'period':>6}{'payment':>12}{'principal':>12}{'interest':>12}{'balance':>14}")
+        for installment in portfolio.schedule(index):
+            print(f"{installment.period:>6}{installment.payment:>12.2f}{installment.principal:>12.2f}"
+                  f"{installment.interest:>12.2f}{installment.balance:>14.2f}")
+
+
+def claims_command(args) -> None:
+    start = time.perf_counter()
+    result = banking_core.process_claims(args.path, args.chunk_size)
+    elapsed = time.perf_counter() - start
+    processed = result['approved'] + len(result['rejected'])
+    print(f"Processed {processed} claims in {elapsed:.2f}s ({processed / elapsed if elapsed else 0:.0f} claims/s): "
+          f"{result['approved']} approved for {result['paid']} Tk/=, {len(result['rejected'])} rejected.")
+    for line_number, policy_number, reason in result['rejected'][:args.show_rejects]:
+        print(f"  line {line_number}: {policy_number}: {reason}")
+
+
+def prune_keys_command(args) -> None:
+    pruned = banking_core.prune_idempotency_keys(args.max_age_hours * 3600)
+    print(f"Removed {pruned} idempotency keys older than {args.max_age_hours:g} hours.")
+
+
+def reconcile_command(args) -> None:
+    result = banking_core.reconcile_balances(args.report, args.checkpoint, args.batch_size, args.restart)
+    resumed = " (resumed from checkpoint)" if result['resumed'] else ""
+    print(f"Reconciled {result['accounts']} accounts in {result['seconds']:.2f}s{resumed}: "
+          f"{result['mismatches']} mismatches written to {args.report}.")
+    print(f"Balances total {result['balance_total']} Tk/=, ledger total {result['ledger_total']} Tk/=.")
+
+
+def reshard_command(args) -> None:
+    start = time.perf_counter()
+    result = banking_core.reshard(args.shards)
+    moved = ', '.join(f"{count} {table}" for table, count in result['copied'].items())
+    print(f"Resharded from {result['previous']} to {result['shards']} shards in {time.perf_counter() - start:.2f}s "
+          f"({moved}).")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintenance tools for the mobile banking database.")
+    parser.add_argument('--db', default=banking_core.DB_PATH, help="database file (default: %(default)s)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = commands.add_parser('import', help="bulk import accounts from a .csv or .jsonl file")
+    import_parser.add_argument('path')
+    import_parser.add_argument('--chunk-size', type=int, default=50000)
+    import_parser.add_argument('--show-rejects', type=int, default=20)
+    import_parser.set_defaults(handler=import_command)
+
+    export_parser = commands.add_parser('export', help="export all accounts to a .csv or .jsonl file")
+    export_parser.add_argument('path')
+    export_parser.set_defaults(handler=export_command)
+
+    accrue_parser = commands.add_parser('accrue', help="credit end-of-day interest to all savings accounts")
+    accrue_parser.add_argument('--periods-per-year', type=int, default=365)
+    accrue_parser.add_argument('--dry-run', action='store_true')
+    accrue_parser.add_argument('--date', help="accrual day, YYYY-MM-DD (default: today); each day is credited once")
+    accrue_parser.set_defaults(handler=accrue_command)
+
+    loans_parser = commands.add_parser('loans', help="next-month installments and arrears across all loans")
+    loans_parser.add_argument('--schedule', metavar='PHONE_NUMBER', help="also print this loan's full schedule")
+    loans_parser.set_defaults(handler=loans_command)
+
+    claims_parser = commands.add_parser('claims', help="validate and pay out insurance claims from a .csv or .jsonl file")
+    claims_parser.add_argument('path')
+    claims_parser.add_argument('--chunk-size', type=int, default=5000)
+    claims_parser.add_argument('--show-rejects', type=int, default=20)
+    claims_parser.set_defaults(handler=claims_command)
+
+    prune_parser = commands.add_parser('prune-keys', help="forget idempotency keys past their retry window")
+    prune_parser.add_argument('--max-age-hours', type=float, default=24.0)
+    prune_parser.set_defaults(handler=prune_keys_command)
+
+    reconcile_parser = commands.add_parser('reconcile', help="check every balance against the sum of its ledger rows")
+    reconcile_parser.add_argument('--report', default='reconciliation.csv', help="mismatch report (default: %(default)s)")
+    reconcile_parser.add_argument('--checkpoint', help="progress file (default: the report path + .checkpoint)")
+    reconcile_parser.add_argument('--batch-size', type=int, default=100000, help="accounts per read snapshot")
+    reconcile_parser.add_argument('--restart', action='store_true', help="ignore an existing checkpoint")
+    reconcile_parser.set_defaults(handler=reconcile_command)
+
+    reshard_parser = commands.add_parser('reshard', help="redistribute all rows over a new number of shard files "
+                                                         "(offline; back up first)")
+    reshard_parser.add_argument('--shards', type=int, required=True)
+    reshard_parser.set_defaults(handler=reshard_command)
+
+    args = parser.parse_args()
+    banking_core.db_pool.path = args.db
+    banking_core.initialize_database()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""Shared core of the mobile banking front-ends: schema, data access, accounts and the Tkinter GUI."""
+from .accounts import (AccountTable, InsuranceAccount, LoanAccount, MobileMoneyAccount, SavingsAccount,
+                       build_account)
+from .bloom import BloomFilter
+from .bulk import accrue_interest, export_accounts, import_accounts, process_claims, reshard
+from .cache import AccountCache, account_cache
+from .db import (ACCOUNT_COLUMNS, ACCOUNT_TYPES, DB_PATH, AccountDirectory, AccountHandle, ConnectionPool,
+                 account_directory, create_account_in_db, create_loan_in_db, create_policy_in_db, db_pool,
+                 get_account_from_db, get_loan_from_db, get_policy_holder_from_db, get_statement_page,
+                 initialize_database, prune_idempotency_keys, recover_transfers, registered_numbers_filter,
+                 transfer_across_shards, transfer_funds_in_db, transfer_many_in_db, update_account_in_db,
+                 update_pin_hash_in_db)
+from .idempotency import IdempotencyCache
+from .ledger import LedgerWriter
+from .loans import Installment, LoanPortfolio, amortization_schedule, monthly_payment, scheduled_balance
+from .metrics import MetricsDumper, MetricsRegistry, metrics, timed
+from .money import Money
+from .reconcile import Reconciler, reconcile_balances
+from .security import PinHasher, hash_pin, pin_needs_rehash, verify_pin
+from .service import AccountLocks, BankingService, RpcClient, RpcError
+from .snapshot import SnapshotWriter, load_snapshot, write_snapshot
+from .system import AccountManager, MobileBankingSystem, MobileBankingSystemController
+from .tasks import Task, TaskExecutor
+from .velocity import DEFAULT_VELOCITY_LIMITS, VelocityLimit, VelocityTracker
+from .gui import GUI, StatementView
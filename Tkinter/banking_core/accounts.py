@@ -0,0 +1,128 @@
+from array import array
+
+from .db import ACCOUNT_TYPES, db_pool
+from .money import Money
+
+
+class MobileMoneyAccount:
+    __slots__ = ('phone_number', 'balance', 'pin_hash', 'name', 'version')
+    account_type = 'mobile'
+
+    def __init__(self, phone_number: str, balance: int, pin_hash: str, name: str = None):
+        # balances and amounts are Money, exact poisha; a plain int here is taken as poisha as well
+        self.phone_number = phone_number
+        self.balance = Money(balance or 0)
+        self.pin_hash = pin_hash
+        self.name = name
+        self.version = 0
+
+    def deposit(self, amount: Money) -> None:
+        self.balance += amount
+        print(f"{self.phone_number} Deposited {amount} Tk/=. Current balance is: {self.balance} Tk/=")
+
+    def withdraw(self, amount: Money) -> None:
+        if self.balance >= amount:
+            self.balance -= amount
+            print(f"{self.phone_number} Withdrew {amount} Tk/=. Current balance is: {self.balance} Tk/=")
+        else:
+            print("You don't have enough funds to withdraw.")
+
+
+class SavingsAccount(MobileMoneyAccount):
+    __slots__ = ('interest_rate',)
+    account_type = 'savings'
+
+    def __init__(self, phone_number: str, balance: int, pin_hash: str, interest_rate: float, name: str = None):
+        super().__init__(phone_number, balance, pin_hash, name)
+        self.interest_rate = interest_rate
+
+    def calculate_interest(self) -> Money:
+        return self.balance * self.interest_rate
+
+
+class LoanAccount(MobileMoneyAccount):
+    __slots__ = ('loan_amount',)
+    account_type = 'loan'
+
+    def __init__(self, phone_number: str, balance: int, pin_hash: str, loan_amount: int, name: str = None):
+        super().__init__(phone_number, balance, pin_hash, name)
+        self.loan_amount = Money(loan_amount or 0)
+
+    def repay_loan(self, amount: Money) -> bool:
+        if amount <= 0:
+            print("Invalid repayment amount.")
+            return False
+        if amount > self.loan_amount:
+            print("Amount is more than the loan.")
+            return False
+        self.loan_amount -= amount
+        print(f"Loan repaid with amount {amount}. Remaining loan: {self.loan_amount}")
+        return True
+
+
+class InsuranceAccount(MobileMoneyAccount):
+    __slots__ = ('policy_number',)
+    account_type = 'insurance'
+
+    def __init__(self, phone_number: str, balance: int, pin_hash: str, policy_number: str, name: str = None):
+        super().__init__(phone_number, balance, pin_hash, name)
+        self.policy_number = policy_number
+
+    def claim_insurance(self, claim_amount: Money) -> None:
+        print(f"Insurance claim of {claim_amount} has been made on policy number {self.policy_number}")
+
+
+def build_account(phone_number, balance, pin_hash, account_type, interest_rate=None, loan_amount=None, policy_number=None,
+                  name=None, version=0):
+    if account_type == 'savings':
+        account = SavingsAccount(phone_number, balance, pin_hash, interest_rate, name)
+    elif account_type == 'loan':
+        account = LoanAccount(phone_number, balance, pin_hash, loan_amount, name)
+    elif account_type == 'insurance':
+        account = InsuranceAccount(phone_number, balance, pin_hash, policy_number, name)
+    else:
+        account = MobileMoneyAccount(phone_number, balance, pin_hash, name)
+    account.version = version
+    return account
+
+
+class AccountTable:
+    # one contiguous array per column instead of one object per account; money columns are int64 poisha
+    TYPE_CODES = {account_type: code for code, account_type in enumerate(ACCOUNT_TYPES)}
+
+    def __init__(self):
+        self.phone_numbers = []
+        self.balances = array('q')
+        self.types = array('b')
+        self.interest_rates = array('d')
+        self.loan_amounts = array('q')
+
+    def append(self, phone_number, balance, account_type, interest_rate=None, loan_amount=None) -> None:
+        self.phone_numbers.append(phone_number)
+        self.balances.append(balance or 0)
+        self.types.append(self.TYPE_CODES.get(account_type, 0))
+        self.interest_rates.append(interest_rate or 0.0)
+        self.loan_amounts.append(loan_amount or 0)
+
+    @classmethod
+    def from_db(cls, batch_size: int = 50000) -> 'AccountTable':
+        table = cls()
+        for shard in range(db_pool.shards):
+            cursor = db_pool.connection(shard).execute(
+                'SELECT phone_number, balance, account_type, interest_rate, loan_amount FROM accounts')
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    table.append(*row)
+        return table
+
+    def column(self, name: str) -> array:
+        return getattr(self, name)
+
+    def type_mask(self, account_type: str):
+        return map(self.TYPE_CODES[account_type].__eq__, self.types)
+
+    def __len__(self) -> int:
+        return len(self.phone_numbers)
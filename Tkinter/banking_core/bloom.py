@@ -0,0 +1,66 @@
+import math
+import threading
+
+MASK_64 = (1 << 64) - 1
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, false_positive_rate: float = 0.01):
+        # sized so that capacity keys give about false_positive_rate; "not in" is always exact
+        if not 0 < false_positive_rate < 1:
+            raise ValueError("false_positive_rate must be between 0 and 1")
+        self.capacity = max(capacity, 1)
+        self.false_positive_rate = false_positive_rate
+        self.bits = max(math.ceil(-self.capacity * math.log(false_positive_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(round(self.bits / self.capacity * math.log(2)), 1)
+        self.items = 0
+        self._array = bytearray((self.bits + 7) // 8)
+        self._lock = threading.Lock()
+
+    def _set(self, key: str) -> None:
+        # double hashing over the two halves of one 64-bit hash; the filter never leaves the process, so the
+        # per-process str hash seed is fine, and hash() is cached on the string
+        value = hash(key) & MASK_64
+        position, step = value & 0xFFFFFFFF, (value >> 32) | 1
+        array, bits = self._array, self.bits
+        for _ in range(self.hashes):
+            bit = position % bits
+            array[bit >> 3] |= 1 << (bit & 7)
+            position += step
+        self.items += 1
+
+    def add(self, key: str) -> None:
+        # setting a bit is a read-modify-write of its byte, so concurrent adds must not interleave
+        with self._lock:
+            self._set(key)
+
+    def add_many(self, keys) -> None:
+        with self._lock:
+            for key in keys:
+                self._set(key)
+
+    def __contains__(self, key: str) -> bool:
+        value = hash(key) & MASK_64
+        position, step = value & 0xFFFFFFFF, (value >> 32) | 1
+        array, bits = self._array, self.bits
+        for _ in range(self.hashes):
+            bit = position % bits
+            if not array[bit >> 3] & (1 << (bit & 7)):
+                return False
+            position += step
+        return True
+
+    def __len__(self) -> int:
+        return self.items
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self._array)
+
+    def expected_false_positive_rate(self) -> float:
+        return (1 - math.exp(-self.hashes * self.items / self.bits)) ** self.hashes
+
+    def stats(self) -> dict:
+        return {'items': self.items, 'capacity': self.capacity, 'bits': self.bits, 'hashes': self.hashes,
+                'memory_bytes': self.memory_bytes, 'target_false_positive_rate': self.false_positive_rate,
+                'expected_false_positive_rate': self.expected_false_positive_rate()}
@@ -0,0 +1,390 @@
+import csv
+import heapq
+import json
+import os
+import time
+from itertools import islice
+
+from .cache import account_cache
+from .db import (ACCOUNT_COLUMNS, ACCOUNT_TYPES, DEFAULT_LOAN_RATE, DEFAULT_LOAN_TERM_MONTHS, DEFAULT_POLICY_COVERAGE,
+                 DEFAULT_POLICY_PER_CLAIM, INDEXES, INSERT_ACCOUNT, INSERT_LOAN, INSERT_POLICY, ConnectionPool,
+                 account_directory, claim_in_transaction, db_pool, migrate)
+from .money import Money
+
+
+def _optional_float(value):
+    return None if value in (None, '') else float(value)
+
+
+def _optional_money(value):
+    return None if value in (None, '') else Money.from_taka(value)
+
+
+def _account_row(record) -> tuple:
+    phone_number = str(record.get('phone_number') or '').strip()
+    if not phone_number:
+        raise ValueError("missing phone_number")
+    account_type = record.get('account_type') or 'mobile'
+    if account_type not in ACCOUNT_TYPES:
+        raise ValueError(f"unknown account_type {account_type!r}")
+    if not record.get('pin_hash'):
+        raise ValueError("missing pin_hash")
+    balance = Money.from_taka(record.get('balance') or 0)
+    if balance < 0:
+        raise ValueError("negative balance")
+    loan_amount = _optional_money(record.get('loan_amount'))
+    if loan_amount is not None and loan_amount < 0:
+        raise ValueError("negative loan_amount")
+    return (phone_number, balance, record['pin_hash'], account_type, _optional_float(record.get('interest_rate')),
+            loan_amount, record.get('policy_number') or None, record.get('name') or None)
+
+
+def read_records(path):
+    # yields (record, error) pairs; a line that isn't a JSON object comes back as an error so the caller can
+    # reject it and carry on
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            for line in f:
+                if line.strip():
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        yield None, f"malformed JSON: {e.msg}"
+                        continue
+                    if isinstance(record, dict):
+                        yield record, None
+                    else:
+                        yield None, "not a JSON object"
+        else:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            for row in reader:
+                yield dict(zip(header, row)), None
+
+
+def _insert_account_chunk(chunk, rejected) -> int:
+    # a policy number may be taken in any shard, so they are all checked before the per-shard inserts
+    taken = _policy_owners(row[6] for _, row in chunk if row[3] == 'insurance' and row[6])
+    by_shard = {}
+    for line_number, row in chunk:
+        if row[3] == 'insurance' and row[6] in taken:
+            rejected.append((line_number, row[0], "policy_number already registered"))
+            continue
+        by_shard.setdefault(db_pool.shard_of(row[0]), []).append((line_number, row))
+    return sum(_insert_shard_chunk(shard, shard_chunk, rejected) for shard, shard_chunk in by_shard.items())
+
+
+def _insert_shard_chunk(shard, chunk, rejected) -> int:
+    now = time.time()
+    with db_pool.transaction(shard) as c:
+        phone_numbers = [row[0] for _, row in chunk]
+        existing = set()
+        for start in range(0, len(phone_numbers), 500):
+            part = phone_numbers[start:start + 500]
+            placeholders = ','.join('?' * len(part))
+            existing.update(r[0] for r in c.execute(
+                f'SELECT phone_number FROM accounts WHERE phone_number IN ({placeholders})', part))
+        rows = []
+        for line_number, row in chunk:
+            if row[0] in existing:
+                rejected.append((line_number, row[0], "phone_number already registered"))
+            else:
+                rows.append(row)
+        c.executemany(INSERT_ACCOUNT, rows)
+        c.executemany('INSERT INTO transactions (phone_number, kind, amount, counterparty, ts) VALUES (?, ?, ?, NULL, ?)',
+                      [(row[0], 'opening', row[1], now) for row in rows if row[1]])
+        # imported loans start a fresh schedule on the default terms
+        c.executemany(INSERT_LOAN, [(row[0], row[5], DEFAULT_LOAN_RATE, DEFAULT_LOAN_TERM_MONTHS, now)
+                                    for row in rows if row[3] == 'loan' and row[5]])
+        c.executemany(INSERT_POLICY, [(row[6], row[0], DEFAULT_POLICY_COVERAGE, DEFAULT_POLICY_PER_CLAIM)
+                                      for row in rows if row[3] == 'insurance' and row[6]])
+    return len(rows)
+
+
+def import_accounts(path: str, chunk_size: int = 50000) -> dict:
+    # accepts .csv or .jsonl with ACCOUNT_COLUMNS; bad or duplicate rows are reported, not fatal
+    # secondary indexes are rebuilt once at the end instead of maintained row by row; they come back from INDEXES,
+    # whose IF NOT EXISTS lets a concurrent start that already restored them go unnoticed
+    for shard in range(db_pool.shards):
+        for name in INDEXES:
+            db_pool.connection(shard).execute(f'DROP INDEX IF EXISTS {name}')
+    imported = 0
+    rejected = []
+    try:
+        seen = set()
+        policies_seen = set()
+        chunk = []
+        for line_number, (record, error) in enumerate(read_records(path), 1):
+            if error is not None:
+                rejected.append((line_number, None, error))
+                continue
+            try:
+                row = _account_row(record)
+            except (ValueError, TypeError) as e:
+                rejected.append((line_number, record.get('phone_number'), str(e)))
+                continue
+            if row[0] in seen:
+                rejected.append((line_number, row[0], "duplicate phone_number in file"))
+                continue
+            if row[3] == 'insurance' and row[6]:
+                if row[6] in policies_seen:
+                    rejected.append((line_number, row[0], "duplicate policy_number in file"))
+                    continue
+                policies_seen.add(row[6])
+            seen.add(row[0])
+            chunk.append((line_number, row))
+            if len(chunk) >= chunk_size:
+                imported += _insert_account_chunk(chunk, rejected)
+                chunk = []
+        if chunk:
+            imported += _insert_account_chunk(chunk, rejected)
+    finally:
+        for shard in range(db_pool.shards):
+            for sql in INDEXES.values():
+                db_pool.connection(shard).execute(sql)
+        account_directory.clear()
+    rejected.sort(key=lambda reject: reject[0])
+    return {'imported': imported, 'rejected': rejected}
+
+
+def _fetch_batches(cursor, batch_size: int):
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def _export_row(row) -> tuple:
+    # files carry taka, as import expects
+    phone_number, balance, pin_hash, account_type, interest_rate, loan_amount, policy_number, name = row
+    return (phone_number, Money(balance).taka, pin_hash, account_type, interest_rate,
+            None if loan_amount is None else Money(loan_amount).taka, policy_number, name)
+
+
+def export_accounts(path: str, batch_size: int = 10000) -> int:
+    # each shard is read in phone_number order and the streams merged, so the file is ordered as before
+    cursors = [db_pool.connection(shard).execute(f'SELECT {", ".join(ACCOUNT_COLUMNS)} FROM accounts '
+                                                 f'ORDER BY phone_number')
+               for shard in range(db_pool.shards)]
+    merged = heapq.merge(*(_fetch_batches(cursor, batch_size) for cursor in cursors))
+    exported = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = None if path.endswith('.jsonl') else csv.writer(f)
+        if writer:
+            writer.writerow(ACCOUNT_COLUMNS)
+        while True:
+            rows = list(map(_export_row, islice(merged, batch_size)))
+            if not rows:
+                break
+            if writer:
+                writer.writerows(rows)
+            else:
+                f.writelines(json.dumps(dict(zip(ACCOUNT_COLUMNS, row))) + '\n' for row in rows)
+            exported += len(rows)
+    return exported
+
+
+def accrue_interest(periods_per_year: int = 365, dry_run: bool = False, accrual_date: str = None) -> dict:
+    # one set-based pass per shard: the ledger rows and balance updates share the same expression and filter
+    # balances are poisha, so rounding to a whole number rounds the interest to the poisha.
+    # Each shard records the date it accrued, so re-running a day, or retrying after a shard failed, skips the
+    # shards already credited
+    accrual_date = accrual_date or time.strftime('%Y-%m-%d')
+    interest = 'CAST(ROUND(balance * interest_rate / ?) AS INTEGER)'
+    eligible = f"account_type='savings' AND interest_rate > 0 AND balance > 0 AND {interest} > 0"
+    count = 0
+    total = 0
+    skipped = 0
+    for shard in range(db_pool.shards):
+        if dry_run:
+            conn = db_pool.connection(shard)
+            if conn.execute(SELECT_ACCRUAL, (accrual_date,)).fetchone():
+                skipped += 1
+                continue
+            shard_count, shard_total = conn.execute(
+                f'SELECT COUNT(*), COALESCE(SUM({interest}), 0) FROM accounts WHERE {eligible}',
+                (periods_per_year, periods_per_year)).fetchone()
+        else:
+            with db_pool.transaction(shard) as c:
+                if c.execute(SELECT_ACCRUAL, (accrual_date,)).fetchone():
+                    skipped += 1
+                    continue
+                shard_count, shard_total = c.execute(
+                    f'SELECT COUNT(*), COALESCE(SUM({interest}), 0) FROM accounts WHERE {eligible}',
+                    (periods_per_year, periods_per_year)).fetchone()
+                c.execute(f"INSERT INTO transactions (phone_number, kind, amount, counterparty, ts) "
+                          f"SELECT phone_number, 'interest', {interest}, NULL, ? FROM accounts WHERE {eligible}",
+                          (periods_per_year, time.time(), periods_per_year))
+                c.execute(f'UPDATE accounts SET balance = balance + {interest}, version = version + 1 WHERE {eligible}',
+                          (periods_per_year, periods_per_year))
+                c.execute(INSERT_ACCRUAL, (accrual_date, shard_count, shard_total, time.time()))
+        count += shard_count
+        total += shard_total
+    if not dry_run:
+        account_cache.clear()
+    return {'accounts': count, 'total_interest': Money(total), 'dry_run': dry_run, 'date': accrual_date,
+            'skipped_shards': skipped}
+
+
+SELECT_ACCRUAL = 'SELECT 1 FROM accruals WHERE accrual_date=?'
+INSERT_ACCRUAL = 'INSERT INTO accruals (accrual_date, accounts, total, ts) VALUES (?, ?, ?, ?)'
+
+
+def _policy_owners(policy_numbers) -> dict:
+    # policy_number -> (shard, phone_number) for every policy that exists in some shard
+    policy_numbers = list(policy_numbers)
+    owners = {}
+    for shard in range(db_pool.shards):
+        conn = db_pool.connection(shard)
+        for start in range(0, len(policy_numbers), 500):
+            part = policy_numbers[start:start + 500]
+            placeholders = ','.join('?' * len(part))
+            owners.update((policy_number, (shard, phone_number)) for policy_number, phone_number in conn.execute(
+                f'SELECT policy_number, phone_number FROM policies WHERE policy_number IN ({placeholders})', part))
+    return owners
+
+
+def _claim_chunk(chunk, rejected, touched) -> tuple:
+    # unknown policies are still recorded as rejected claims, in the base shard
+    owners = _policy_owners({policy_number for _, policy_number, _, _ in chunk})
+    by_shard = {}
+    for claim in chunk:
+        by_shard.setdefault(owners.get(claim[1], (0, None))[0], []).append(claim)
+    approved = 0
+    paid = Money(0)
+    for shard, claims in by_shard.items():
+        with db_pool.transaction(shard) as c:
+            for line_number, policy_number, amount, claim_ref in claims:
+                error = claim_in_transaction(c, policy_number, amount, claim_ref)
+                if error is None:
+                    approved += 1
+                    paid += amount
+                    touched.add(owners[policy_number][1])
+                else:
+                    rejected.append((line_number, policy_number, error))
+    return approved, paid
+
+
+def process_claims(path: str, chunk_size: int = 5000) -> dict:
+    # accepts .csv or .jsonl with policy_number, amount and an optional claim_ref; one transaction per shard per chunk
+    approved = 0
+    paid = Money(0)
+    rejected = []
+    touched = set()
+    chunk = []
+    for line_number, (record, error) in enumerate(read_records(path), 1):
+        if error is not None:
+            rejected.append((line_number, None, error))
+            continue
+        policy_number = str(record.get('policy_number') or '').strip()
+        try:
+            amount = Money.from_taka(record.get('amount'))
+        except ValueError:
+            rejected.append((line_number, policy_number, "invalid amount"))
+            continue
+        chunk.append((line_number, policy_number, amount, record.get('claim_ref') or None))
+        if len(chunk) >= chunk_size:
+            counts = _claim_chunk(chunk, rejected, touched)
+            approved, paid = approved + counts[0], paid + counts[1]
+            chunk = []
+    if chunk:
+        counts = _claim_chunk(chunk, rejected, touched)
+        approved, paid = approved + counts[0], paid + counts[1]
+    # cached accounts that were paid out now hold a stale balance
+    for phone_number in touched:
+        account_cache.invalidate(phone_number)
+    rejected.sort(key=lambda reject: reject[0])
+    return {'approved': approved, 'paid': paid, 'rejected': rejected}
+
+
+# what each table is copied as when rows move between shards; ids are reassigned, in the original order
+RESHARD_TABLES = (
+    ('accounts', ACCOUNT_COLUMNS + ('version',), 'accounts'),
+    ('transactions', ('phone_number', 'kind', 'amount', 'counterparty', 'ts'), 'transactions ORDER BY id'),
+    ('loans', ('phone_number', 'principal', 'annual_rate', 'term_months', 'start_ts'), 'loans'),
+    ('policies', ('policy_number', 'phone_number', 'coverage_limit', 'per_claim_limit', 'claimed_total',
+                  'claim_count'), 'policies'),
+    ('claims', ('policy_number', 'claim_ref', 'amount', 'status', 'reason', 'ts'),
+     'claims LEFT JOIN policies USING (policy_number) ORDER BY claims.id'),
+)
+
+
+def reshard(shards: int, batch_size: int = 50000) -> dict:
+    # offline: copies every row into a fresh set of files laid out for the new shard count, then swaps them in.
+    # Nothing else may have the database open, and the swap is per file, so keep a backup.
+    if shards < 1:
+        raise ValueError("shards must be at least 1")
+    for shard in range(db_pool.shards):
+        if db_pool.connection(shard).execute('SELECT 1 FROM pending_transfers LIMIT 1').fetchone():
+            raise ValueError("cross-shard transfers are still pending; start the system once to finish them.")
+    # an accrual date travels only if every shard finished it; a half-accrued day has no home after the move
+    accruals = {}
+    for shard in range(db_pool.shards):
+        for row in db_pool.connection(shard).execute('SELECT accrual_date, accounts, total, ts FROM accruals'):
+            accruals.setdefault(row[0], []).append(row)
+    for accrual_date, rows in sorted(accruals.items()):
+        if len(rows) < db_pool.shards:
+            raise ValueError(f"interest for {accrual_date} was accrued on only some shards; "
+                             f"run 'bank_tools.py accrue --date {accrual_date}' first.")
+    root, ext = os.path.splitext(db_pool.path)
+    staging = ConnectionPool(f'{root}.reshard{ext}', shards=shards)
+    for shard in range(shards):
+        _remove_database(staging.shard_path(shard))
+        migrate(staging, shard)
+    staging.connection().execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('shards', ?)", (str(shards),))
+    copied = {}
+    for table, columns, source in RESHARD_TABLES:
+        insert = f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})'
+        copied[table] = 0
+        for shard in range(db_pool.shards):
+            cursor = db_pool.connection(shard).execute(f'SELECT phone_number, {", ".join(columns)} FROM {source}')
+            copied[table] += _copy_rows(cursor, staging, insert, batch_size)
+    # keys name no account, so every shard gets them all; they age out through prune_idempotency_keys
+    keys = 'idempotency_key, operation, result, ts'
+    for shard in range(db_pool.shards):
+        rows = db_pool.connection(shard).execute(f'SELECT {keys} FROM idempotency_keys').fetchall()
+        for target in range(shards if rows else 0):
+            with staging.transaction(target) as c:
+                c.executemany(f'INSERT OR IGNORE INTO idempotency_keys ({keys}) VALUES (?, ?, ?, ?)', rows)
+    for target in range(shards if accruals else 0):
+        # per-shard counts and totals no longer mean anything after the move, so each shard keeps the date only
+        with staging.transaction(target) as c:
+            c.executemany(INSERT_ACCRUAL, [(accrual_date, 0, 0, rows[0][3]) for accrual_date, rows in accruals.items()])
+    previous = db_pool.shards
+    for shard in range(shards):
+        # folds each staging WAL into its file, so the file alone can be moved into place
+        staging.connection(shard).execute('PRAGMA journal_mode=DELETE')
+    staging.close_all()
+    db_pool.close_all()
+    for shard in range(shards):
+        _remove_database(db_pool.shard_path(shard))
+        os.replace(staging.shard_path(shard), db_pool.shard_path(shard))
+    db_pool.shards = shards
+    for shard in range(shards, previous):
+        _remove_database(db_pool.shard_path(shard))
+    account_cache.clear()
+    account_directory.clear()
+    return {'previous': previous, 'shards': shards, 'copied': copied}
+
+
+def _copy_rows(cursor, pool, insert, batch_size) -> int:
+    # the first column of every row is the phone number that picks the target shard; it is not inserted
+    copied = 0
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return copied
+        by_shard = {}
+        for row in rows:
+            by_shard.setdefault(0 if row[0] is None else pool.shard_of(row[0]), []).append(row[1:])
+        for shard, shard_rows in by_shard.items():
+            with pool.transaction(shard) as c:
+                c.executemany(insert, shard_rows)
+        copied += len(rows)
+
+
+def _remove_database(path) -> None:
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
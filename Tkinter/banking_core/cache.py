@@ -0,0 +1,86 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class AccountCache:
+    def __init__(self, max_size: int = 10000, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, phone_number: str):
+        with self._lock:
+            entry = self._entries.get(phone_number)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(phone_number)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[phone_number]
+            self.misses += 1
+            return None
+
+    def peek(self, phone_number: str):
+        # lookup that neither counts towards the hit rate nor refreshes recency
+        entry = self._entries.get(phone_number)
+        return entry[1] if entry is not None and entry[0] > time.monotonic() else None
+
+    def put(self, phone_number: str, account) -> None:
+        with self._lock:
+            self._entries[phone_number] = (time.monotonic() + self.ttl, account)
+            self._entries.move_to_end(phone_number)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def put_many(self, accounts) -> None:
+        # bulk load of (phone_number, account) pairs, oldest first, under one lock and one expiry time
+        with self._lock:
+            expires = time.monotonic() + self.ttl
+            entries = self._entries
+            for phone_number, account in accounts:
+                entries[phone_number] = (expires, account)
+                entries.move_to_end(phone_number)
+            while len(entries) > self.max_size:
+                entries.popitem(last=False)
+
+    def keys(self) -> list:
+        # live entries, least recently used first
+        now = time.monotonic()
+        with self._lock:
+            return [phone_number for phone_number, entry in self._entries.items() if entry[0] > now]
+
+    def invalidate(self, phone_number: str) -> None:
+        with self._lock:
+            self._entries.pop(phone_number, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {'size': len(self._entries), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def __contains__(self, phone_number: str) -> bool:
+        entry = self._entries.get(phone_number)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def __getitem__(self, phone_number: str):
+        account = self.get(phone_number)
+        if account is None:
+            raise KeyError(phone_number)
+        return account
+
+    def __setitem__(self, phone_number: str, account) -> None:
+        self.put(phone_number, account)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+account_cache = AccountCache()
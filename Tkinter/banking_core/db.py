@@ -0,0 +1,718 @@
+import atexit
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from collections import namedtuple
+from contextlib import contextmanager
+
+from .bloom import BloomFilter
+from .cache import AccountCache, account_cache
+from .metrics import timed
+from .money import MAX_AMOUNT, Money
+
+DB_PATH = 'mobile_banking_system.db'
+
+ACCOUNT_COLUMNS = ('phone_number', 'balance', 'pin_hash', 'account_type', 'interest_rate', 'loan_amount',
+                   'policy_number', 'name')
+ACCOUNT_TYPES = ('mobile', 'savings', 'loan', 'insurance')
+DEFAULT_LOAN_RATE = 0.12
+DEFAULT_LOAN_TERM_MONTHS = 12
+DEFAULT_POLICY_COVERAGE = Money.from_taka(100000)
+DEFAULT_POLICY_PER_CLAIM = Money.from_taka(25000)
+# credits from outside the account stop here; the gap to the int64 limit is far wider than any one amount, so a
+# refund of an earlier debit can always be applied on top
+MAX_BALANCE = 1000 * MAX_AMOUNT
+
+# Every hot-path query is a module constant: sqlite3 keeps a per-connection cache of compiled
+# statements keyed on the SQL text, so each of these is prepared once per pooled connection.
+INSERT_ACCOUNT = (f'INSERT INTO accounts ({", ".join(ACCOUNT_COLUMNS)}) '
+                  f'VALUES ({", ".join("?" * len(ACCOUNT_COLUMNS))})')
+SELECT_ACCOUNT = f'SELECT {", ".join(ACCOUNT_COLUMNS)}, version FROM accounts WHERE phone_number=?'
+SELECT_ACCOUNT_TYPE = 'SELECT account_type FROM accounts WHERE phone_number=?'
+UPDATE_ACCOUNT = ('UPDATE accounts SET balance=?, loan_amount=COALESCE(?, loan_amount), name=COALESCE(?, name), '
+                  'version=version+1 WHERE phone_number=? AND (? IS NULL OR version=?)')
+UPDATE_PIN_HASH = 'UPDATE accounts SET pin_hash=? WHERE phone_number=?'
+CREDIT_ACCOUNT = 'UPDATE accounts SET balance = balance + ?, version = version + 1 WHERE phone_number=?'
+CREDIT_ACCOUNT_WITHIN_LIMIT = ('UPDATE accounts SET balance = balance + ?, version = version + 1 '
+                               'WHERE phone_number=? AND balance <= ?')
+DEBIT_ACCOUNT = ('UPDATE accounts SET balance = balance - ?, version = version + 1 '
+                 'WHERE phone_number=? AND balance >= ?')
+INSERT_TRANSACTION = 'INSERT INTO transactions (phone_number, kind, amount, counterparty, ts) VALUES (?, ?, ?, ?, ?)'
+STATEMENT_COLUMNS = 'SELECT id, ts, kind, amount, counterparty FROM transactions WHERE phone_number=?'
+SELECT_STATEMENT_LATEST = f'{STATEMENT_COLUMNS} ORDER BY ts DESC, id DESC LIMIT ?'
+SELECT_STATEMENT_OLDER = f'{STATEMENT_COLUMNS} AND (ts, id) < (?, ?) ORDER BY ts DESC, id DESC LIMIT ?'
+SELECT_STATEMENT_NEWER = f'{STATEMENT_COLUMNS} AND (ts, id) > (?, ?) ORDER BY ts, id LIMIT ?'
+INSERT_LOAN = ('INSERT OR REPLACE INTO loans (phone_number, principal, annual_rate, term_months, start_ts) '
+               'VALUES (?, ?, ?, ?, ?)')
+# a taken policy number is an IntegrityError, never a silently dropped row
+INSERT_POLICY = ('INSERT INTO policies (policy_number, phone_number, coverage_limit, per_claim_limit) '
+                 'VALUES (?, ?, ?, ?)')
+SELECT_POLICY_HOLDER = 'SELECT phone_number FROM policies WHERE policy_number=?'
+SELECT_POLICY = ('SELECT phone_number, coverage_limit, per_claim_limit, claimed_total FROM policies '
+                 'WHERE policy_number=?')
+# claimed_total is a running sum, so the limit check never re-reads the claim history
+CHARGE_POLICY = ('UPDATE policies SET claimed_total = claimed_total + ?, claim_count = claim_count + 1 '
+                 'WHERE policy_number=? AND claimed_total + ? <= coverage_limit')
+SELECT_APPROVED_CLAIM = "SELECT 1 FROM claims WHERE policy_number=? AND claim_ref=? AND status='approved'"
+INSERT_CLAIM = 'INSERT INTO claims (policy_number, claim_ref, amount, status, reason, ts) VALUES (?, ?, ?, ?, ?, ?)'
+SELECT_IDEMPOTENCY_KEY = 'SELECT result FROM idempotency_keys WHERE idempotency_key=?'
+INSERT_IDEMPOTENCY_KEY = ('INSERT OR IGNORE INTO idempotency_keys (idempotency_key, operation, result, ts) '
+                          'VALUES (?, ?, ?, ?)')
+SELECT_LOAN = ('SELECT l.principal, l.annual_rate, l.term_months, l.start_ts, a.loan_amount '
+               'FROM loans l JOIN accounts a USING (phone_number) WHERE l.phone_number=?')
+INSERT_PENDING_TRANSFER = ('INSERT INTO pending_transfers (xid, source, target, amount, idempotency_key, ts) '
+                           'VALUES (?, ?, ?, ?, ?, ?)')
+SELECT_PENDING_TRANSFER = 'SELECT source, target, amount, idempotency_key FROM pending_transfers WHERE xid=?'
+SELECT_APPLIED_TRANSFER = 'SELECT 1 FROM applied_transfers WHERE xid=?'
+INSERT_APPLIED_TRANSFER = 'INSERT INTO applied_transfers (xid, ts) VALUES (?, ?)'
+
+
+class ConnectionPool:
+    def __init__(self, path: str = DB_PATH, cached_statements: int = 256, shards: int = 1):
+        self.path = path
+        self.shards = shards
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def shard_path(self, shard: int) -> str:
+        # shard 0 is the base file, so a single-shard pool is exactly the old single database
+        if shard == 0:
+            return self.path
+        root, ext = os.path.splitext(self.path)
+        return f'{root}.shard{shard}{ext}'
+
+    def shard_of(self, phone_number: str) -> int:
+        # every row belonging to an account lives in the shard its phone number hashes to
+        if self.shards == 1:
+            return 0
+        return zlib.crc32(phone_number.encode()) % self.shards
+
+    def connection(self, shard: int = 0) -> sqlite3.Connection:
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        path = self.shard_path(shard)
+        conn = connections.get(path)
+        if conn is None:
+            # autocommit mode; multi-statement writes go through transaction()
+            conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False,
+                                   cached_statements=self.cached_statements)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA cache_size=-16000')
+            conn.execute('PRAGMA temp_store=MEMORY')
+            conn.execute('PRAGMA busy_timeout=5000')
+            connections[path] = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self, shard: int = 0):
+        conn = self.connection(shard)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn.cursor()
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+
+    @contextmanager
+    def snapshot(self, shard: int = 0):
+        # a deferred read transaction: every query inside sees one WAL snapshot, and writers carry on meanwhile
+        conn = self.connection(shard)
+        conn.execute('BEGIN')
+        try:
+            yield conn
+        finally:
+            conn.execute('COMMIT')
+
+    def close_all(self) -> None:
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+db_pool = ConnectionPool()
+atexit.register(db_pool.close_all)
+
+
+def _create_schema(c) -> None:
+    c.execute('''CREATE TABLE IF NOT EXISTS accounts (
+                    phone_number TEXT PRIMARY KEY,
+                    name TEXT,
+                    balance REAL NOT NULL DEFAULT 0,
+                    pin_hash TEXT,
+                    account_type TEXT,
+                    interest_rate REAL,
+                    loan_amount REAL,
+                    policy_number TEXT,
+                    version INTEGER NOT NULL DEFAULT 0
+                 )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS transactions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    phone_number TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    amount REAL NOT NULL,
+                    counterparty TEXT,
+                    ts REAL NOT NULL
+                 )''')
+
+
+def _add_missing_account_columns(c) -> None:
+    # databases created by the old front-ends lack name (bank.py) or version (mobilebank.py, Test.py)
+    columns = {row[1] for row in c.execute('PRAGMA table_info(accounts)')}
+    for column, definition in (('name', 'TEXT'), ('version', 'INTEGER NOT NULL DEFAULT 0')):
+        if column not in columns:
+            c.execute(f'ALTER TABLE accounts ADD COLUMN {column} {definition}')
+
+
+# import_accounts drops these while it loads, so every start checks they are back
+INDEXES = {
+    'idx_accounts_type': 'CREATE INDEX IF NOT EXISTS idx_accounts_type ON accounts (account_type)',
+    'idx_transactions_account_ts': ('CREATE INDEX IF NOT EXISTS idx_transactions_account_ts '
+                                    'ON transactions (phone_number, ts, id)'),
+}
+
+
+def _create_indexes(c) -> None:
+    for sql in INDEXES.values():
+        c.execute(sql)
+
+
+def _create_loans_table(c) -> None:
+    # repayment terms live beside the account row; accounts.loan_amount stays the outstanding balance
+    c.execute('''CREATE TABLE IF NOT EXISTS loans (
+                    phone_number TEXT PRIMARY KEY,
+                    principal REAL NOT NULL,
+                    annual_rate REAL NOT NULL,
+                    term_months INTEGER NOT NULL,
+                    start_ts REAL NOT NULL
+                 )''')
+    c.execute("INSERT OR IGNORE INTO loans (phone_number, principal, annual_rate, term_months, start_ts) "
+              "SELECT phone_number, loan_amount, ?, ?, ? FROM accounts WHERE account_type='loan' AND loan_amount > 0",
+              (DEFAULT_LOAN_RATE, DEFAULT_LOAN_TERM_MONTHS, time.time()))
+
+
+def _create_claims_tables(c) -> None:
+    c.execute('''CREATE TABLE IF NOT EXISTS policies (
+                    policy_number TEXT PRIMARY KEY,
+                    phone_number TEXT NOT NULL,
+                    coverage_limit REAL NOT NULL,
+                    per_claim_limit REAL NOT NULL,
+                    claimed_total REAL NOT NULL DEFAULT 0,
+                    claim_count INTEGER NOT NULL DEFAULT 0
+                 )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS claims (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    policy_number TEXT NOT NULL,
+                    claim_ref TEXT,
+                    amount REAL NOT NULL,
+                    status TEXT NOT NULL,
+                    reason TEXT,
+                    ts REAL NOT NULL
+                 )''')
+    # a reference may be retried after a rejection, but it can only ever be paid once
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_claims_ref ON claims (policy_number, claim_ref) "
+              "WHERE status='approved'")
+    c.execute("INSERT OR IGNORE INTO policies (policy_number, phone_number, coverage_limit, per_claim_limit) "
+              "SELECT policy_number, phone_number, ?, ? FROM accounts "
+              "WHERE account_type='insurance' AND policy_number IS NOT NULL",
+              (DEFAULT_POLICY_COVERAGE.taka, DEFAULT_POLICY_PER_CLAIM.taka))
+
+
+def _create_idempotency_keys_table(c) -> None:
+    # result is the JSON of what the first execution returned, replayed verbatim to retries
+    c.execute('''CREATE TABLE IF NOT EXISTS idempotency_keys (
+                    idempotency_key TEXT PRIMARY KEY,
+                    operation TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    ts REAL NOT NULL
+                 )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_idempotency_keys_ts ON idempotency_keys (ts)')
+
+
+def _create_sharding_tables(c) -> None:
+    # meta is only read from the base file; the transfer tables are the two halves of a cross-shard transfer
+    c.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+    c.execute('''CREATE TABLE IF NOT EXISTS pending_transfers (
+                    xid TEXT PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    target TEXT NOT NULL,
+                    amount REAL NOT NULL,
+                    idempotency_key TEXT,
+                    ts REAL NOT NULL
+                 )''')
+    c.execute('CREATE TABLE IF NOT EXISTS applied_transfers (xid TEXT PRIMARY KEY, ts REAL NOT NULL)')
+
+
+# money columns hold integer poisha once this has run, and every amount handed to this module is in poisha;
+# rates stay REAL
+MONEY_COLUMNS = {
+    'accounts': ('balance', 'loan_amount'),
+    'transactions': ('amount',),
+    'loans': ('principal',),
+    'policies': ('coverage_limit', 'per_claim_limit', 'claimed_total'),
+    'claims': ('amount',),
+    'pending_transfers': ('amount',),
+}
+
+
+def _table_sql(c, table: str) -> str:
+    return c.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()[0]
+
+
+def _rebuild_table(c, table: str, sql: str, values: dict) -> None:
+    # SQLite can't change a column's type or constraints in place: copy into a table created from sql, swap it
+    # in and recreate its indexes. values maps a column to the expression it is copied with; ids, and with them
+    # AUTOINCREMENT sequences, are copied as they are
+    columns = [row[1] for row in c.execute(f'PRAGMA table_info({table})')]
+    indexes = [row[0] for row in c.execute("SELECT sql FROM sqlite_master WHERE type='index' AND tbl_name=? "
+                                           "AND sql IS NOT NULL", (table,))]
+    c.execute(re.sub(rf'\b{table}\b', f'{table}_rebuilt', sql, count=1))
+    c.execute(f'INSERT INTO {table}_rebuilt ({", ".join(columns)}) '
+              f'SELECT {", ".join(values.get(column, column) for column in columns)} FROM {table}')
+    c.execute(f'DROP TABLE {table}')
+    c.execute(f'ALTER TABLE {table}_rebuilt RENAME TO {table}')
+    for index in indexes:
+        c.execute(index)
+
+
+def _store_money_as_minor_units(c) -> None:
+    # REAL affinity would turn integers back into floats, so each table is rebuilt with INTEGER money columns
+    # and its values converted to poisha
+    for table, money_columns in MONEY_COLUMNS.items():
+        types = {row[1]: row[2].upper() for row in c.execute(f'PRAGMA table_info({table})')}
+        if all(types.get(column) == 'INTEGER' for column in money_columns):
+            # already converted; multiplying again would scale every amount by another hundred
+            continue
+        sql = _table_sql(c, table)
+        for column in money_columns:
+            sql = re.sub(rf'\b{column}\s+REAL\b', f'{column} INTEGER', sql)
+        values = {column: f'CAST(ROUND({column} * 100) AS INTEGER)' for column in money_columns}
+        if table == 'accounts':
+            # legacy front-ends could leave a balance NULL, and balance + ? keeps it NULL forever
+            values['balance'] = 'CAST(ROUND(COALESCE(balance, 0) * 100) AS INTEGER)'
+        _rebuild_table(c, table, sql, values)
+
+
+def _backfill_opening_balances(c) -> None:
+    # balances written before the ledger existed have no rows behind them, so reconciliation would flag every
+    # legacy account; an 'opening' row, like the ones import_accounts writes, covers the gap at upgrade time
+    c.execute("INSERT INTO transactions (phone_number, kind, amount, counterparty, ts) "
+              "SELECT a.phone_number, 'opening', COALESCE(a.balance, 0) - COALESCE(t.total, 0), NULL, "
+              "COALESCE(t.first_ts, ?) FROM accounts a LEFT JOIN "
+              "(SELECT phone_number, SUM(amount) AS total, MIN(ts) AS first_ts FROM transactions "
+              "GROUP BY phone_number) t USING (phone_number) "
+              "WHERE COALESCE(a.balance, 0) != COALESCE(t.total, 0)", (time.time(),))
+
+
+def _create_accruals_table(c) -> None:
+    # one row per shard per accrued day, written in the same transaction as that day's interest
+    c.execute('''CREATE TABLE IF NOT EXISTS accruals (
+                    accrual_date TEXT PRIMARY KEY,
+                    accounts INTEGER NOT NULL,
+                    total INTEGER NOT NULL,
+                    ts REAL NOT NULL
+                 )''')
+
+
+def _require_account_balance(c) -> None:
+    # databases that came from the legacy schema allow a NULL balance; make it NOT NULL DEFAULT 0 like new ones.
+    # The opening rows already count a NULL balance as 0, so the ledger still agrees
+    if any(row[1] == 'balance' and row[3] for row in c.execute('PRAGMA table_info(accounts)')):
+        return
+    sql = re.sub(r'\bbalance\s+INTEGER\b', 'balance INTEGER NOT NULL DEFAULT 0', _table_sql(c, 'accounts'))
+    _rebuild_table(c, 'accounts', sql, {'balance': 'COALESCE(balance, 0)'})
+
+
+# applied in order; PRAGMA user_version records how many have run. Several front-ends may open the same file at
+# once, so migrate() re-reads the version under the write lock and a step never runs twice
+MIGRATIONS = (_create_schema, _add_missing_account_columns, _create_indexes, _create_loans_table,
+              _create_claims_tables, _create_idempotency_keys_table, _create_sharding_tables,
+              _store_money_as_minor_units, _backfill_opening_balances, _create_accruals_table,
+              _require_account_balance)
+
+
+def migrate(pool: ConnectionPool, shard: int = 0) -> None:
+    applied = pool.connection(shard).execute('PRAGMA user_version').fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[applied:], applied + 1):
+        with pool.transaction(shard) as c:
+            # another process may have applied this step while we waited for BEGIN IMMEDIATE
+            if c.execute('PRAGMA user_version').fetchone()[0] >= number:
+                continue
+            migration(c)
+            c.execute(f'PRAGMA user_version = {number}')
+    conn = pool.connection(shard)
+    present = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    if not present.issuperset(INDEXES):
+        # an import that was killed before it could rebuild them
+        _create_indexes(conn)
+
+
+def initialize_database(shards: int = None):
+    # the base file records the shard count; shards defaults to 1 for a new database and must match an existing one
+    migrate(db_pool)
+    # under the write lock, so front-ends opening a new database at once all read back the first count recorded
+    with db_pool.transaction() as c:
+        recorded = c.execute("SELECT 1 FROM meta WHERE key='shards'").fetchone() is not None
+        if not recorded and (shards or 1) > 1 and c.execute('SELECT 1 FROM accounts LIMIT 1').fetchone():
+            raise ValueError(f"{db_pool.path} already holds accounts; use 'bank_tools.py reshard' to split it.")
+        c.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('shards', ?)", (str(shards or 1),))
+        stored = int(c.execute("SELECT value FROM meta WHERE key='shards'").fetchone()[0])
+    if shards is not None and shards != stored:
+        raise ValueError(f"{db_pool.path} is split into {stored} shards, not {shards}; "
+                         f"use 'bank_tools.py reshard' to change it.")
+    db_pool.shards = stored
+    for shard in range(1, stored):
+        migrate(db_pool, shard)
+    recover_transfers()
+
+
+@timed('db.create_account')
+def create_account_in_db(phone_number, balance, pin_hash, account_type, interest_rate=None, loan_amount=None,
+                         policy_number=None, name=None):
+    account_directory.forget(phone_number)
+    db_pool.connection(db_pool.shard_of(phone_number)).execute(
+        INSERT_ACCOUNT,
+        (phone_number, balance, pin_hash, account_type, interest_rate, loan_amount, policy_number, name))
+
+
+@timed('db.create_loan')
+def create_loan_in_db(phone_number, principal, annual_rate=DEFAULT_LOAN_RATE, term_months=DEFAULT_LOAN_TERM_MONTHS,
+                      start_ts=None):
+    db_pool.connection(db_pool.shard_of(phone_number)).execute(
+        INSERT_LOAN, (phone_number, principal, annual_rate, term_months, time.time() if start_ts is None else start_ts))
+
+
+@timed('db.create_policy')
+def create_policy_in_db(phone_number, policy_number, coverage_limit=DEFAULT_POLICY_COVERAGE,
+                        per_claim_limit=DEFAULT_POLICY_PER_CLAIM):
+    # a policy lives beside its holder's account, so a claim credits it without leaving the shard
+    db_pool.connection(db_pool.shard_of(phone_number)).execute(
+        INSERT_POLICY, (policy_number, phone_number, coverage_limit, per_claim_limit))
+
+
+@timed('db.get_policy_holder')
+def get_policy_holder_from_db(policy_number):
+    # policies are filed under their holder's shard, so an unknown number has to be looked for in every shard
+    for shard in range(db_pool.shards):
+        row = db_pool.connection(shard).execute(SELECT_POLICY_HOLDER, (policy_number,)).fetchone()
+        if row is not None:
+            return row[0]
+    return None
+
+
+@timed('db.get_idempotency_key')
+def get_idempotency_result_from_db(idempotency_key, phone_number=None):
+    # returns a 1-tuple holding the stored result, or None if the key was never used; a key is filed in the
+    # shard of the account its operation committed in
+    shard = 0 if phone_number is None else db_pool.shard_of(phone_number)
+    row = db_pool.connection(shard).execute(SELECT_IDEMPOTENCY_KEY, (idempotency_key,)).fetchone()
+    return None if row is None else (json.loads(row[0]),)
+
+
+def record_idempotency_key(c, idempotency_key, operation, result):
+    c.execute(INSERT_IDEMPOTENCY_KEY, (idempotency_key, operation, json.dumps(result), time.time()))
+
+
+def prune_idempotency_keys(max_age: float) -> int:
+    cutoff = time.time() - max_age
+    return sum(db_pool.connection(shard).execute('DELETE FROM idempotency_keys WHERE ts < ?', (cutoff,)).rowcount
+               for shard in range(db_pool.shards))
+
+
+@timed('db.get_loan')
+def get_loan_from_db(phone_number):
+    c = db_pool.connection(db_pool.shard_of(phone_number)).cursor()
+    c.row_factory = sqlite3.Row
+    return c.execute(SELECT_LOAN, (phone_number,)).fetchone()
+
+
+@timed('db.get_account')
+def get_account_from_db(phone_number):
+    c = db_pool.connection(db_pool.shard_of(phone_number)).cursor()
+    c.row_factory = sqlite3.Row
+    return c.execute(SELECT_ACCOUNT, (phone_number,)).fetchone()
+
+
+@timed('db.update_account')
+def update_account_in_db(phone_number, balance, loan_amount=None, name=None, expected_version=None,
+                         idempotency_key=None, operation='update_account'):
+    # with expected_version this is a compare-and-swap that only succeeds if nobody wrote the row since it was read.
+    # With idempotency_key, None means the key was already committed, by this or another front-end, and nothing
+    # was written
+    if expected_version is None:
+        account_cache.invalidate(phone_number)
+    shard = db_pool.shard_of(phone_number)
+    parameters = (balance, loan_amount, name, phone_number, expected_version, expected_version)
+    if idempotency_key is None:
+        return db_pool.connection(shard).execute(UPDATE_ACCOUNT, parameters).rowcount == 1
+    # the key commits with the update, so no crash can leave a change that a retry of the key would repeat
+    with db_pool.transaction(shard) as c:
+        # checked again under the write lock: the caller's lookup can't stop a front-end that passed it at the
+        # same time
+        if c.execute(SELECT_IDEMPOTENCY_KEY, (idempotency_key,)).fetchone() is not None:
+            return None
+        c.execute(UPDATE_ACCOUNT, parameters)
+        if c.rowcount != 1:
+            return False
+        record_idempotency_key(c, idempotency_key, operation, True)
+    return True
+
+
+@timed('db.update_pin_hash')
+def update_pin_hash_in_db(phone_number, pin_hash):
+    db_pool.connection(db_pool.shard_of(phone_number)).execute(UPDATE_PIN_HASH, (pin_hash, phone_number))
+
+
+def record_transaction(c, phone_number, kind, amount, counterparty=None):
+    c.execute(INSERT_TRANSACTION, (phone_number, kind, amount, counterparty, time.time()))
+
+
+def deposit_in_transaction(c, phone_number, amount):
+    if amount is None or not 0 < amount <= MAX_AMOUNT:
+        return "Invalid deposit amount."
+    c.execute(CREDIT_ACCOUNT_WITHIN_LIMIT, (amount, phone_number, MAX_BALANCE - amount))
+    if c.rowcount == 0:
+        return "Account not found or balance limit reached."
+    record_transaction(c, phone_number, 'deposit', amount)
+    return None
+
+
+def withdraw_in_transaction(c, phone_number, amount):
+    if amount is None or not 0 < amount <= MAX_AMOUNT:
+        return "Invalid withdrawal amount."
+    c.execute(DEBIT_ACCOUNT, (amount, phone_number, amount))
+    if c.rowcount == 0:
+        return "You don't have enough funds to withdraw."
+    record_transaction(c, phone_number, 'withdraw', -amount)
+    return None
+
+
+def claim_in_transaction(c, policy_number, amount, claim_ref=None, claimant=None):
+    # every claim is stored, approved or not; only approved ones move money. claimant, when given, is the account
+    # making the claim, and must hold the policy
+    error, phone_number = _check_claim(c, policy_number, amount, claim_ref, claimant)
+    if error is None:
+        c.execute(CREDIT_ACCOUNT, (amount, phone_number))
+        record_transaction(c, phone_number, 'claim', amount, policy_number)
+    c.execute(INSERT_CLAIM, (policy_number, claim_ref, amount if isinstance(amount, int) else 0,
+                             'rejected' if error else 'approved', error, time.time()))
+    return error
+
+
+def _check_claim(c, policy_number, amount, claim_ref, claimant=None):
+    if not isinstance(amount, int) or not 0 < amount <= MAX_AMOUNT:
+        return "Invalid claim amount.", None
+    policy = c.execute(SELECT_POLICY, (policy_number,)).fetchone()
+    if policy is None:
+        return "Unknown policy number.", None
+    phone_number, coverage_limit, per_claim_limit, claimed_total = policy
+    if claimant is not None and claimant != phone_number:
+        return "The policy belongs to another account.", None
+    if amount > per_claim_limit:
+        return f"Claim exceeds the per-claim limit of {Money(per_claim_limit)} Tk/=.", phone_number
+    if claim_ref is not None and c.execute(SELECT_APPROVED_CLAIM, (policy_number, claim_ref)).fetchone():
+        return "Duplicate claim reference.", phone_number
+    c.execute(CHARGE_POLICY, (amount, policy_number, amount))
+    if c.rowcount == 0:
+        return f"Claim exceeds the remaining coverage of {Money(coverage_limit - claimed_total)} Tk/=.", phone_number
+    return None, phone_number
+
+
+def transfer_in_transaction(c, source_phone_number, target_phone_number, amount):
+    if amount is None or not 0 < amount <= MAX_AMOUNT:
+        return "Invalid transfer amount."
+    if source_phone_number == target_phone_number:
+        return "Cannot transfer to the same account."
+    c.execute(DEBIT_ACCOUNT, (amount, source_phone_number, amount))
+    if c.rowcount == 0:
+        return "Insufficient balance or unknown source account."
+    c.execute(CREDIT_ACCOUNT_WITHIN_LIMIT, (amount, target_phone_number, MAX_BALANCE - amount))
+    if c.rowcount == 0:
+        # undo the debit inside the same transaction
+        c.execute(CREDIT_ACCOUNT, (amount, source_phone_number))
+        return "Target account not found or balance limit reached."
+    record_transaction(c, source_phone_number, 'transfer', -amount, target_phone_number)
+    record_transaction(c, target_phone_number, 'transfer', amount, source_phone_number)
+    return None
+
+
+def prepare_transfer_in_transaction(c, source_phone_number, target_phone_number, amount, xid, idempotency_key=None):
+    # phase one, in the source shard: debit and log the intent; the credit happens in another file and commit
+    if amount is None or not 0 < amount <= MAX_AMOUNT:
+        return "Invalid transfer amount."
+    c.execute(DEBIT_ACCOUNT, (amount, source_phone_number, amount))
+    if c.rowcount == 0:
+        return "Insufficient balance or unknown source account."
+    c.execute(INSERT_PENDING_TRANSFER, (xid, source_phone_number, target_phone_number, amount, idempotency_key,
+                                        time.time()))
+    record_transaction(c, source_phone_number, 'transfer', -amount, target_phone_number)
+    return None
+
+
+def credit_transfer_in_transaction(c, xid, source_phone_number, target_phone_number, amount):
+    # phase two, in the target shard; applied_transfers makes a retried credit a no-op
+    if c.execute(SELECT_APPLIED_TRANSFER, (xid,)).fetchone():
+        return None
+    c.execute(CREDIT_ACCOUNT_WITHIN_LIMIT, (amount, target_phone_number, MAX_BALANCE - amount))
+    if c.rowcount == 0:
+        return "Target account not found or balance limit reached."
+    c.execute(INSERT_APPLIED_TRANSFER, (xid, time.time()))
+    record_transaction(c, target_phone_number, 'transfer', amount, source_phone_number)
+    return None
+
+
+def settle_transfer_in_transaction(c, xid, error=None):
+    # phase three, back in the source shard: drop the intent, refunding the debit if the credit was refused
+    pending = c.execute(SELECT_PENDING_TRANSFER, (xid,)).fetchone()
+    if pending is None:
+        return error
+    source_phone_number, target_phone_number, amount, idempotency_key = pending
+    c.execute('DELETE FROM pending_transfers WHERE xid=?', (xid,))
+    if error is not None:
+        c.execute(CREDIT_ACCOUNT, (amount, source_phone_number))
+        record_transaction(c, source_phone_number, 'reversal', amount, target_phone_number)
+        if idempotency_key is not None:
+            c.execute('UPDATE idempotency_keys SET result=? WHERE idempotency_key=?', (json.dumps(error),
+                                                                                      idempotency_key))
+    return error
+
+
+def finish_transfer(xid, source_phone_number, target_phone_number, amount):
+    with db_pool.transaction(db_pool.shard_of(target_phone_number)) as c:
+        error = credit_transfer_in_transaction(c, xid, source_phone_number, target_phone_number, amount)
+    with db_pool.transaction(db_pool.shard_of(source_phone_number)) as c:
+        return settle_transfer_in_transaction(c, xid, error)
+
+
+def transfer_across_shards(source_phone_number, target_phone_number, amount):
+    xid = uuid.uuid4().hex
+    with db_pool.transaction(db_pool.shard_of(source_phone_number)) as c:
+        error = prepare_transfer_in_transaction(c, source_phone_number, target_phone_number, amount, xid)
+    if error is not None:
+        return error
+    return finish_transfer(xid, source_phone_number, target_phone_number, amount)
+
+
+def recover_transfers() -> int:
+    # completes cross-shard transfers a crash left between phases; every phase is idempotent, so this is
+    # safe to run while another process is finishing the same transfers
+    recovered = 0
+    for shard in range(db_pool.shards):
+        pending = db_pool.connection(shard).execute('SELECT xid, source, target, amount FROM pending_transfers')
+        for xid, source_phone_number, target_phone_number, amount in pending.fetchall():
+            finish_transfer(xid, source_phone_number, target_phone_number, amount)
+            recovered += 1
+    return recovered
+
+
+@timed('db.transfer_funds')
+def transfer_funds_in_db(source_phone_number, target_phone_number, amount):
+    shard = db_pool.shard_of(source_phone_number)
+    if shard != db_pool.shard_of(target_phone_number):
+        return transfer_across_shards(source_phone_number, target_phone_number, amount)
+    with db_pool.transaction(shard) as c:
+        return transfer_in_transaction(c, source_phone_number, target_phone_number, amount)
+
+
+@timed('db.transfer_many')
+def transfer_many_in_db(batch, chunk_size=1000):
+    # same-shard transfers are committed in chunks, in batch order within each shard; the rest go one by one
+    # through the cross-shard protocol afterwards
+    by_shard = {}
+    crossing = []
+    for index, (source_phone_number, target_phone_number, _) in enumerate(batch):
+        shard = db_pool.shard_of(source_phone_number)
+        if shard == db_pool.shard_of(target_phone_number):
+            by_shard.setdefault(shard, []).append(index)
+        else:
+            crossing.append(index)
+    failures = []
+    for shard, indices in by_shard.items():
+        for start in range(0, len(indices), chunk_size):
+            with db_pool.transaction(shard) as c:
+                for index in indices[start:start + chunk_size]:
+                    error = transfer_in_transaction(c, *batch[index])
+                    if error is not None:
+                        failures.append((index, error))
+    for index in crossing:
+        error = transfer_across_shards(*batch[index])
+        if error is not None:
+            failures.append((index, error))
+    failures.sort()
+    return failures
+
+
+@timed('db.statement_page')
+def get_statement_page(phone_number, cursor=None, limit=50, newer=False):
+    # keyset pagination over (ts, id); cursor is the (ts, id) of the row to page away from
+    conn = db_pool.connection(db_pool.shard_of(phone_number))
+    if cursor is None:
+        return conn.execute(SELECT_STATEMENT_LATEST, (phone_number, limit)).fetchall()
+    if newer:
+        rows = conn.execute(SELECT_STATEMENT_NEWER, (phone_number, cursor[0], cursor[1], limit)).fetchall()
+        rows.reverse()
+        return rows
+    return conn.execute(SELECT_STATEMENT_OLDER, (phone_number, cursor[0], cursor[1], limit)).fetchall()
+
+
+AccountHandle = namedtuple('AccountHandle', ['phone_number', 'account_type'])
+
+
+class AccountDirectory:
+    def __init__(self, negative_cache_size: int = 4096, negative_ttl: float = 30.0):
+        # remembers recently missed numbers so repeated lookups of a typo don't hit the DB
+        self._unknown = AccountCache(negative_cache_size, negative_ttl)
+
+    @timed('db.lookup_account')
+    def lookup(self, phone_number: str):
+        account = account_cache.peek(phone_number)
+        if account is not None:
+            return AccountHandle(phone_number, account.account_type)
+        if phone_number in self._unknown:
+            return None
+        row = db_pool.connection(db_pool.shard_of(phone_number)).execute(SELECT_ACCOUNT_TYPE,
+                                                                         (phone_number,)).fetchone()
+        if row is None:
+            self._unknown.put(phone_number, True)
+            return None
+        return AccountHandle(phone_number, row[0])
+
+    def forget(self, phone_number: str) -> None:
+        self._unknown.invalidate(phone_number)
+
+    def clear(self) -> None:
+        self._unknown.clear()
+
+
+account_directory = AccountDirectory()
+
+
+@timed('db.registered_numbers')
+def registered_numbers_filter(false_positive_rate: float = 0.01, headroom: float = 2.0,
+                              batch_size: int = 50000) -> BloomFilter:
+    # every registered phone number, sized for headroom times today's book so onboarding has room to grow
+    count = sum(db_pool.connection(shard).execute('SELECT COUNT(*) FROM accounts').fetchone()[0]
+                for shard in range(db_pool.shards))
+    registered = BloomFilter(max(int(count * headroom), batch_size), false_positive_rate)
+    for shard in range(db_pool.shards):
+        cursor = db_pool.connection(shard).execute('SELECT phone_number FROM accounts')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            registered.add_many(row[0] for row in rows)
+    return registered
@@ -0,0 +1,346 @@
+import time
+import tkinter as tk
+from tkinter import messagebox, simpledialog
+
+from .accounts import InsuranceAccount, LoanAccount, SavingsAccount
+from .money import Money
+from .system import MobileBankingSystemController
+from .tasks import TaskExecutor
+
+
+class StatementView:
+    def __init__(self, master, controller: MobileBankingSystemController, tasks: TaskExecutor, account,
+                 page_size: int = 20):
+        # only the visible page is ever held in memory; paging is driven by (ts, id) keyset cursors
+        self.controller = controller
+        self.tasks = tasks
+        self.account = account
+        self.page_size = page_size
+        self.rows = []
+
+        self.window = tk.Toplevel(master)
+        self.window.title(f"Statement - {account.phone_number}")
+        self.window.configure(bg="#fffde7")
+
+        self.listbox = tk.Listbox(self.window, height=page_size, width=60, font=("Courier", 10), activestyle="none")
+        self.listbox.pack(padx=10, pady=10, fill="both", expand=True)
+        for sequence, handler in (("<MouseWheel>", self._on_wheel), ("<Button-4>", lambda e: self.newer()),
+                                  ("<Button-5>", lambda e: self.older()), ("<Prior>", lambda e: self.newer()),
+                                  ("<Next>", lambda e: self.older())):
+            self.listbox.bind(sequence, handler)
+
+        nav_frame = tk.Frame(self.window, bg="#fffde7")
+        nav_frame.pack(pady=10)
+        tk.Button(nav_frame, text="Newer", command=self.newer, bg="#007bff", fg="white",
+                  font=("Arial", 12)).pack(side="left", padx=5)
+        tk.Button(nav_frame, text="Latest", command=self.latest, bg="#28a745", fg="white",
+                  font=("Arial", 12)).pack(side="left", padx=5)
+        tk.Button(nav_frame, text="Older", command=self.older, bg="#007bff", fg="white",
+                  font=("Arial", 12)).pack(side="left", padx=5)
+
+        self.latest()
+
+    def _load(self, cursor=None, newer=False) -> None:
+        self.tasks.submit(self.account.phone_number, self.controller.statement_page, self.account, cursor,
+                          self.page_size, newer, on_success=lambda rows: self._show(rows, newer))
+
+    def latest(self) -> None:
+        self._load()
+
+    def older(self) -> None:
+        if self.rows:
+            last = self.rows[-1]
+            self._load((last[1], last[0]))
+
+    def newer(self) -> None:
+        if self.rows:
+            first = self.rows[0]
+            self._load((first[1], first[0]), newer=True)
+
+    def _on_wheel(self, event) -> None:
+        if event.delta > 0:
+            self.newer()
+        else:
+            self.older()
+
+    def _show(self, rows: list, newer: bool) -> None:
+        if not self.window.winfo_exists():
+            return
+        if newer and len(rows) < self.page_size:
+            # close to the top: show the latest full page rather than a short one
+            self.latest()
+            return
+        if not rows and self.rows:
+            return
+        self.rows = rows
+        self.listbox.delete(0, tk.END)
+        for _, ts, kind, amount, counterparty in rows:
+            when = time.strftime('%Y-%m-%d %H:%M', time.localtime(ts))
+            self.listbox.insert(tk.END, f"{when}  {kind:<9}{Money(amount):>12}  {counterparty or ''}")
+        if not rows:
+            self.listbox.insert(tk.END, "No transactions yet.")
+
+
+class GUI:
+    def __init__(self, master, mobile_banking_system_controller: MobileBankingSystemController, ask_name: bool = False):
+        self.master = master
+        self.mobile_banking_system_controller = mobile_banking_system_controller
+        self.ask_name = ask_name
+        self.tasks = TaskExecutor(self.master, on_busy_change=self.set_busy)
+
+        self.status_label = tk.Label(self.master, text="", bg="#eceff1", font=("Arial", 10))
+        self.status_label.pack(side="bottom", fill="x")
+
+        self.create_account_frame = tk.Frame(self.master, bg="#e0f7fa")
+        self.create_account_frame.pack(fill="both", expand=True)
+
+        self.login_frame = tk.Frame(self.master, bg="#e8f5e9")
+        self.login_frame.pack(fill="both", expand=True)
+
+        self.create_account_widgets()
+        self.login_widgets()
+
+    def create_account_widgets(self) -> None:
+        title = tk.Label(self.create_account_frame, text="Create Account", font=("Arial", 24, "bold"), bg="#e0f7fa",
+                         fg="#00796b")
+        title.pack(pady=20)
+
+        phone_label = tk.Label(self.create_account_frame, text="Phone Number:", bg="#e0f7fa", font=("Arial", 12))
+        phone_label.pack(pady=5)
+        self.phone_number_entry = tk.Entry(self.create_account_frame, width=30, font=("Arial", 12))
+        self.phone_number_entry.pack(pady=5)
+
+        self.name_entry = None
+        if self.ask_name:
+            name_label = tk.Label(self.create_account_frame, text="Name:", bg="#e0f7fa", font=("Arial", 12))
+            name_label.pack(pady=5)
+            self.name_entry = tk.Entry(self.create_account_frame, width=30, font=("Arial", 12))
+            self.name_entry.pack(pady=5)
+
+        pin_label = tk.Label(self.create_account_frame, text="PIN:", bg="#e0f7fa", font=("Arial", 12))
+        pin_label.pack(pady=5)
+        self.pin_entry = tk.Entry(self.create_account_frame, width=30, show="*", font=("Arial", 12))
+        self.pin_entry.pack(pady=5)
+
+        account_type_label = tk.Label(self.create_account_frame, text="Account Type:", bg="#e0f7fa", font=("Arial", 12))
+        account_type_label.pack(pady=5)
+        self.account_type_var = tk.StringVar()
+        self.account_type_var.set("mobile")
+        account_type_menu = tk.OptionMenu(self.create_account_frame, self.account_type_var, "mobile", "savings", "loan",
+                                          "insurance")
+        account_type_menu.config(font=("Arial", 12))
+        account_type_menu.pack(pady=5)
+
+        self.create_button = tk.Button(self.create_account_frame, text="Create Account", command=self.create_account,
+                                       bg="#00796b", fg="white", font=("Arial", 14))
+        self.create_button.pack(pady=20)
+
+        clear_button = tk.Button(self.create_account_frame, text="Clear", command=self.clear_create_account_fields,
+                                 bg="#c62828", fg="white", font=("Arial", 14))
+        clear_button.pack(pady=10)
+
+    def login_widgets(self) -> None:
+        title = tk.Label(self.login_frame, text="Login", font=("Arial", 24, "bold"), bg="#e8f5e9", fg="#388e3c")
+        title.pack(pady=20)
+
+        phone_label = tk.Label(self.login_frame, text="Phone Number:", bg="#e8f5e9", font=("Arial", 12))
+        phone_label.pack(pady=5)
+        self.login_phone_number_entry = tk.Entry(self.login_frame, width=30, font=("Arial", 12))
+        self.login_phone_number_entry.pack(pady=5)
+
+        pin_label = tk.Label(self.login_frame, text="PIN:", bg="#e8f5e9", font=("Arial", 12))
+        pin_label.pack(pady=5)
+        self.login_pin_entry = tk.Entry(self.login_frame, width=30, show="*", font=("Arial", 12))
+        self.login_pin_entry.pack(pady=5)
+
+        self.login_button = tk.Button(self.login_frame, text="Login", command=self.login, bg="#388e3c", fg="white",
+                                      font=("Arial", 14))
+        self.login_button.pack(pady=20)
+
+        clear_button = tk.Button(self.login_frame, text="Clear", command=self.clear_login_fields, bg="#c62828",
+                                 fg="white", font=("Arial", 14))
+        clear_button.pack(pady=10)
+
+    def account_operations_widgets(self, account) -> None:
+        self.current_account = account
+        self.account_operations_window = tk.Toplevel(self.master)
+        self.account_operations_window.title("Account Operations")
+        self.account_operations_window.geometry("400x660")
+        self.account_operations_window.configure(bg="#fffde7")
+
+        title = tk.Label(self.account_operations_window, text="Account Operations", font=("Arial", 24, "bold"),
+                         bg="#fffde7", fg="#f9a825")
+        title.pack(pady=20)
+
+        deposit_button = tk.Button(self.account_operations_window, text="Deposit",
+                                   command=lambda: self.deposit(account), bg="#28a745", fg="white", font=("Arial", 14))
+        deposit_button.pack(pady=10)
+
+        withdraw_button = tk.Button(self.account_operations_window, text="Withdraw",
+                                    command=lambda: self.withdraw(account), bg="#ff913c", fg="white",
+                                    font=("Arial", 14))
+        withdraw_button.pack(pady=10)
+
+        transfer_button = tk.Button(self.account_operations_window, text="Transfer",
+                                    command=lambda: self.transfer(account), bg="#007bff", fg="white",
+                                    font=("Arial", 14))
+        transfer_button.pack(pady=10)
+
+        check_balance_button = tk.Button(self.account_operations_window, text="Check Balance",
+                                         command=lambda: self.check_balance(account), bg="#fbc02d", fg="white",
+                                         font=("Arial", 14))
+        check_balance_button.pack(pady=10)
+
+        interest_button = tk.Button(self.account_operations_window, text="Calculate Interest",
+                                    command=lambda: self.calculate_interest(account), bg="#7f04a3", fg="white",
+                                    font=("Arial", 14))
+        interest_button.pack(pady=10)
+
+        repay_button = tk.Button(self.account_operations_window, text="Repay Loan",
+                                 command=lambda: self.repay_loan(account), bg="#615f61", fg="white", font=("Arial", 14))
+        repay_button.pack(pady=10)
+
+        claim_button = tk.Button(self.account_operations_window, text="Claim Insurance",
+                                 command=lambda: self.claim_insurance(account), bg="#fc82ff", fg="white",
+                                 font=("Arial", 14))
+        claim_button.pack(pady=10)
+
+        statement_button = tk.Button(self.account_operations_window, text="Statement",
+                                     command=lambda: self.statement(account), bg="#00796b", fg="white",
+                                     font=("Arial", 14))
+        statement_button.pack(pady=10)
+
+        logout_button = tk.Button(self.account_operations_window, text="Logout", command=self.logout, bg="#c62828",
+                                  fg="white", font=("Arial", 14))
+        logout_button.pack(pady=20)
+
+    def clear_create_account_fields(self) -> None:
+        self.phone_number_entry.delete(0, tk.END)
+        if self.name_entry is not None:
+            self.name_entry.delete(0, tk.END)
+        self.pin_entry.delete(0, tk.END)
+        self.account_type_var.set("mobile")
+
+    def clear_login_fields(self) -> None:
+        self.login_phone_number_entry.delete(0, tk.END)
+        self.login_pin_entry.delete(0, tk.END)
+
+    def create_account(self) -> None:
+        phone_number = self.phone_number_entry.get()
+        name = self.name_entry.get() if self.name_entry is not None else None
+        pin = self.pin_entry.get()
+        account_type = self.account_type_var.get()
+        additional_kwargs = {}
+        if account_type == "savings":
+            interest_rate = simpledialog.askfloat("Input", "Enter Interest Rate:")
+            additional_kwargs['interest_rate'] = interest_rate
+        elif account_type == "loan":
+            loan_amount = simpledialog.askfloat("Input", "Enter Loan Amount:")
+            additional_kwargs['loan_amount'] = loan_amount
+        elif account_type == "insurance":
+            policy_number = simpledialog.askstring("Input", "Enter Policy Number:")
+            additional_kwargs['policy_number'] = policy_number
+        # hashing the PIN takes a noticeable moment, so it runs off the Tk thread like login
+        self.create_button.config(state=tk.DISABLED)
+        self.tasks.submit(phone_number, lambda: self.mobile_banking_system_controller.create_account(
+                              phone_number, pin, account_type, name, **additional_kwargs),
+                          on_success=self._finish_create_account, on_error=self._create_account_failed)
+
+    def _finish_create_account(self, created) -> None:
+        self.create_button.config(state=tk.NORMAL)
+        if created:
+            messagebox.showinfo("Success", "Account created successfully!")
+        else:
+            messagebox.showerror("Error", "Account creation failed.")
+
+    def _create_account_failed(self, error) -> None:
+        self.create_button.config(state=tk.NORMAL)
+        messagebox.showerror("Error", f"Account creation failed: {error}")
+
+    def set_busy(self, busy: bool) -> None:
+        self.master.config(cursor="watch" if busy else "")
+        self.status_label.config(text="Working..." if busy else "")
+
+    def show_result(self, error, success_message: str) -> None:
+        if error is None:
+            messagebox.showinfo("Success", success_message)
+        else:
+            messagebox.showerror("Error", error)
+
+    def login(self) -> None:
+        phone_number = self.login_phone_number_entry.get()
+        pin = self.login_pin_entry.get()
+        self.login_button.config(state=tk.DISABLED)
+        self.tasks.submit(phone_number, self.mobile_banking_system_controller.login, phone_number, pin,
+                          on_success=self._finish_login, on_error=self._login_failed)
+
+    def _finish_login(self, account) -> None:
+        self.login_button.config(state=tk.NORMAL)
+        if account:
+            self.account_operations_widgets(account)
+            self.login_frame.pack_forget()
+        else:
+            messagebox.showerror("Error", "Login failed.")
+
+    def _login_failed(self, error) -> None:
+        self.login_button.config(state=tk.NORMAL)
+        messagebox.showerror("Error", f"Login failed: {error}")
+
+    def deposit(self, account) -> None:
+        amount = simpledialog.askfloat("Input", "Enter deposit amount:")
+        self.tasks.submit(account.phone_number, self.mobile_banking_system_controller.deposit, account, amount,
+                          on_success=lambda error: self.show_result(error, "Deposit successful!"))
+
+    def withdraw(self, account) -> None:
+        amount = simpledialog.askfloat("Input", "Enter withdrawal amount:")
+        self.tasks.submit(account.phone_number, self.mobile_banking_system_controller.withdraw, account, amount,
+                          on_success=lambda error: self.show_result(error, "Withdrawal successful!"))
+
+    def transfer(self, account) -> None:
+        target_phone_number = simpledialog.askstring("Input", "Enter target phone number:")
+        amount = simpledialog.askfloat("Input", "Enter transfer amount:")
+        self.tasks.submit(account.phone_number, self._transfer_task, account, target_phone_number, amount,
+                          on_success=lambda error: self.show_result(error, "Transfer successful!"))
+
+    def _transfer_task(self, account, target_phone_number: str, amount: float):
+        target_account = self.mobile_banking_system_controller.find_account(target_phone_number)
+        if target_account is None:
+            return "Target account not found."
+        return self.mobile_banking_system_controller.transfer(account, target_account, amount)
+
+    def check_balance(self, account) -> None:
+        balance = account.balance
+        messagebox.showinfo("Balance", f"Your current balance is: {balance} Tk/=")
+
+    def calculate_interest(self, account) -> None:
+        if isinstance(account, SavingsAccount):
+            interest = self.mobile_banking_system_controller.calculate_interest(account)
+            messagebox.showinfo("Interest", f"Calculated interest: {interest}")
+        else:
+            messagebox.showerror("Error", "This operation is not available for your account type.")
+
+    def repay_loan(self, account) -> None:
+        if isinstance(account, LoanAccount):
+            amount = simpledialog.askfloat("Input", "Enter repayment amount:")
+            self.tasks.submit(account.phone_number, self.mobile_banking_system_controller.repay_loan, account, amount,
+                              on_success=lambda ok: self.show_result(None if ok else "Loan repayment failed.",
+                                                                     "Loan repayment successful!"))
+        else:
+            messagebox.showerror("Error", "This operation is not available for your account type.")
+
+    def claim_insurance(self, account) -> None:
+        if isinstance(account, InsuranceAccount):
+            claim_amount = simpledialog.askfloat("Input", "Enter claim amount:")
+            self.tasks.submit(account.phone_number, self.mobile_banking_system_controller.claim_insurance, account,
+                              claim_amount,
+                              on_success=lambda error: self.show_result(error, "Insurance claim successful!"))
+        else:
+            messagebox.showerror("Error", "This operation is not available for your account type.")
+
+    def statement(self, account) -> None:
+        StatementView(self.master, self.mobile_banking_system_controller, self.tasks, account)
+
+    def logout(self) -> None:
+        self.tasks.cancel_all(self.current_account.phone_number)
+        self.account_operations_window.destroy()
+        self.login_frame.pack(fill="both", expand=True)
@@ -0,0 +1,51 @@
+import threading
+from concurrent.futures import Future
+
+from .cache import AccountCache
+from .db import get_idempotency_result_from_db
+from .ledger import completed_future, copy_outcome
+
+
+class IdempotencyCache:
+    def __init__(self, max_size: int = 100000, ttl: float = 3600.0):
+        # recent keys map to the future of their first execution; older ones fall back to the indexed table
+        self._recent = AccountCache(max_size, ttl)
+        self._lock = threading.Lock()
+        self.replays = 0
+
+    def run(self, idempotency_key: str, start, phone_number: str = None) -> Future:
+        # start() performs the operation and returns its future; it is called at most once per key.
+        # phone_number is the account the operation commits in, whose shard holds the stored key
+        if idempotency_key is None:
+            return start()
+        with self._lock:
+            future = self._recent.get(idempotency_key)
+            if future is not None:
+                self.replays += 1
+                return future
+            future = Future()
+            self._recent.put(idempotency_key, future)
+        try:
+            stored = get_idempotency_result_from_db(idempotency_key, phone_number)
+            if stored is not None:
+                self.replays += 1
+                inner = completed_future(stored[0])
+            else:
+                inner = start()
+        except BaseException as e:
+            self._recent.invalidate(idempotency_key)
+            future.set_exception(e)
+            raise
+        inner.add_done_callback(lambda f: self._finish(idempotency_key, f, future))
+        return future
+
+    def _finish(self, idempotency_key: str, inner: Future, future: Future) -> None:
+        # a failure (a commit that raised) never ran the operation to completion, so a retry with the key must run
+        # it again rather than replay the exception
+        if inner.exception() is not None:
+            self._recent.invalidate(idempotency_key)
+        copy_outcome(inner, future)
+
+    def __len__(self) -> int:
+        return len(self._recent)
+
@@ -0,0 +1,175 @@
+import json
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+from .db import (SELECT_IDEMPOTENCY_KEY, claim_in_transaction, credit_transfer_in_transaction, db_pool,
+                 deposit_in_transaction, prepare_transfer_in_transaction, record_idempotency_key,
+                 settle_transfer_in_transaction, transfer_in_transaction, withdraw_in_transaction)
+from .metrics import metrics
+
+
+def completed_future(result) -> Future:
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def copy_outcome(source: Future, target: Future) -> None:
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+def then(future: Future, callback) -> Future:
+    # the returned future resolves only after callback has seen the committed result. A commit that raised is
+    # handed to callback as its error too, so optimistic in-memory changes are undone either way
+    chained = Future()
+
+    def done(f: Future) -> None:
+        if f.exception() is not None:
+            try:
+                callback(f.exception())
+            finally:
+                chained.set_exception(f.exception())
+            return
+        try:
+            callback(f.result())
+        except Exception as e:
+            chained.set_exception(e)
+        else:
+            chained.set_result(f.result())
+
+    future.add_done_callback(done)
+    return chained
+
+
+class LedgerWriter:
+    OPERATIONS = {
+        'deposit': deposit_in_transaction,
+        'withdraw': withdraw_in_transaction,
+        'transfer': transfer_in_transaction,
+        'claim': claim_in_transaction,
+        'prepare_transfer': prepare_transfer_in_transaction,
+        'credit_transfer': credit_transfer_in_transaction,
+        'settle_transfer': settle_transfer_in_transaction,
+    }
+
+    def __init__(self, flush_interval: float = 0.005, max_batch: int = 512):
+        # one queue and writer thread per shard; shards never share a write lock, so they commit in parallel
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._queues = [queue.Queue() for _ in range(db_pool.shards)]
+        self._threads = [threading.Thread(target=self._run, args=(shard,), name=f'ledger-writer-{shard}', daemon=True)
+                         for shard in range(db_pool.shards)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, kind: str, *args, idempotency_key: str = None, shard: int = None) -> Future:
+        # resolves to None once committed, or to the reason the operation was rejected; shard defaults to that
+        # of the account in args[0]
+        if shard is None:
+            shard = db_pool.shard_of(args[0])
+        if kind == 'transfer' and db_pool.shard_of(args[1]) != shard:
+            kind, args = 'prepare_transfer', (*args, uuid.uuid4().hex, idempotency_key)
+        return self._enqueue(shard, kind, args, idempotency_key)
+
+    def _enqueue(self, shard: int, kind: str, args: tuple, idempotency_key: str = None) -> Future:
+        future = Future()
+        future.replayed = False
+        self._queues[shard].put((kind, args, future, idempotency_key))
+        return future
+
+    def close(self) -> None:
+        # a cross-shard transfer caught mid-way stays in pending_transfers and is finished on the next start
+        for shard_queue, thread in zip(self._queues, self._threads):
+            if thread.is_alive():
+                shard_queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self, shard: int) -> None:
+        # in WAL mode synchronous=NORMAL may lose the last commits on power loss; a resolved future promises the
+        # write is on disk, and one fsync per group commit is cheap
+        db_pool.connection(shard).execute('PRAGMA synchronous=FULL')
+        shard_queue = self._queues[shard]
+        stopping = False
+        while not stopping:
+            item = shard_queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = shard_queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(shard, batch)
+
+    def _commit(self, shard: int, batch: list) -> None:
+        # each operation runs in its own savepoint, so one that raises is rolled back and fails alone while the
+        # rest of the group still commits; only a failed commit fails the whole batch
+        results, errors = [], []
+        try:
+            with metrics.timer('ledger.commit'), db_pool.transaction(shard) as c:
+                for kind, args, future, idempotency_key in batch:
+                    c.execute('SAVEPOINT operation')
+                    try:
+                        results.append(self._apply(c, kind, args, future, idempotency_key))
+                        errors.append(None)
+                    except Exception as e:
+                        c.execute('ROLLBACK TO operation')
+                        future.replayed = False
+                        results.append(None)
+                        errors.append(e)
+                    c.execute('RELEASE operation')
+        except Exception as e:
+            for _, _, future, _ in batch:
+                future.set_exception(e)
+            return
+        for (kind, args, future, _), result, error in zip(batch, results, errors):
+            if error is not None:
+                future.set_exception(error)
+            elif kind == 'prepare_transfer' and result is None and not future.replayed:
+                self._finish_transfer(args, future)
+            else:
+                future.set_result(result)
+
+    def _finish_transfer(self, args: tuple, future: Future) -> None:
+        # the debit is committed; credit on the target shard's writer, then settle back on the source's
+        source_phone_number, target_phone_number, amount, xid, _ = args
+        credited = self._enqueue(db_pool.shard_of(target_phone_number), 'credit_transfer',
+                                 (xid, source_phone_number, target_phone_number, amount))
+
+        def settle(f: Future) -> None:
+            if f.exception() is not None:
+                # left pending; recover_transfers() retries the credit
+                future.set_exception(f.exception())
+                return
+            settled = self._enqueue(db_pool.shard_of(source_phone_number), 'settle_transfer', (xid, f.result()))
+            settled.add_done_callback(lambda s: copy_outcome(s, future))
+
+        credited.add_done_callback(settle)
+
+    def _apply(self, c, kind: str, args: tuple, future: Future, idempotency_key: str):
+        if idempotency_key is None:
+            return self.OPERATIONS[kind](c, *args)
+        # checked under the write lock, so two writers racing on one key can't both execute it
+        stored = c.execute(SELECT_IDEMPOTENCY_KEY, (idempotency_key,)).fetchone()
+        if stored is not None:
+            future.replayed = True
+            return json.loads(stored[0])
+        result = self.OPERATIONS[kind](c, *args)
+        record_idempotency_key(c, idempotency_key, kind, result)
+        return result
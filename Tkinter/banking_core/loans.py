@@ -0,0 +1,121 @@
+import time
+from array import array
+from collections import namedtuple
+from functools import lru_cache
+
+from .db import db_pool, get_loan_from_db
+from .money import MINOR_UNITS
+
+SECONDS_PER_MONTH = 365.25 / 12 * 86400
+
+Installment = namedtuple('Installment', ['period', 'payment', 'principal', 'interest', 'balance'])
+
+
+def monthly_payment(principal: float, annual_rate: float, term_months: int) -> float:
+    rate = annual_rate / 12
+    if rate == 0:
+        return principal / term_months
+    return principal * rate / (1 - (1 + rate) ** -term_months)
+
+
+def scheduled_balance(principal: float, annual_rate: float, term_months: int, period: int) -> float:
+    # closed form B_k = L*g^k - P*(g^k - 1)/r, so any period is O(1) without walking the ones before it
+    if period >= term_months:
+        return 0.0
+    if period <= 0:
+        return principal
+    rate = annual_rate / 12
+    payment = monthly_payment(principal, annual_rate, term_months)
+    if rate == 0:
+        return principal - payment * period
+    growth = (1 + rate) ** period
+    return max(principal * growth - payment * (growth - 1) / rate, 0.0)
+
+
+@lru_cache(maxsize=4096)
+def amortization_schedule(principal: float, annual_rate: float, term_months: int) -> tuple:
+    # keyed on the loan terms, so a cached schedule is dropped naturally when any of them changes
+    rate = annual_rate / 12
+    balances = [scheduled_balance(principal, annual_rate, term_months, k) for k in range(term_months + 1)]
+    return tuple(Installment(k, round(balances[k - 1] * (1 + rate) - balances[k], 2),
+                             round(balances[k - 1] - balances[k], 2), round(balances[k - 1] * rate, 2),
+                             round(balances[k], 2))
+                 for k in range(1, term_months + 1))
+
+
+def elapsed_periods(start_ts: float, now: float = None) -> int:
+    return max(int(((time.time() if now is None else now) - start_ts) // SECONDS_PER_MONTH), 0)
+
+
+def next_installment(principal: float, annual_rate: float, term_months: int, start_ts: float, outstanding: float,
+                     now: float = None) -> float:
+    # the regular payment plus whatever the borrower is behind the schedule, capped at paying the loan off
+    period = elapsed_periods(start_ts, now)
+    if outstanding <= 0:
+        return 0.0
+    arrears = max(outstanding - scheduled_balance(principal, annual_rate, term_months, period), 0.0)
+    payoff = outstanding * (1 + annual_rate / 12)
+    return round(min(monthly_payment(principal, annual_rate, term_months) + arrears, payoff), 2)
+
+
+def loan_schedule(phone_number: str) -> tuple:
+    loan = get_loan_from_db(phone_number)
+    if loan is None:
+        return ()
+    return amortization_schedule(loan['principal'] / MINOR_UNITS, loan['annual_rate'], loan['term_months'])
+
+
+class LoanPortfolio:
+    # columnar like AccountTable; a whole-portfolio pass is one comprehension over parallel arrays.
+    # Schedules are float maths, so the portfolio holds taka rather than the stored poisha.
+    def __init__(self):
+        self.phone_numbers = []
+        self.principals = array('d')
+        self.annual_rates = array('d')
+        self.terms = array('i')
+        self.start_times = array('d')
+        self.outstanding = array('d')
+
+    def append(self, phone_number, principal, annual_rate, term_months, start_ts, outstanding) -> None:
+        self.phone_numbers.append(phone_number)
+        self.principals.append(principal)
+        self.annual_rates.append(annual_rate)
+        self.terms.append(term_months)
+        self.start_times.append(start_ts)
+        self.outstanding.append(outstanding or 0.0)
+
+    @classmethod
+    def from_db(cls, batch_size: int = 50000) -> 'LoanPortfolio':
+        portfolio = cls()
+        for shard in range(db_pool.shards):
+            cursor = db_pool.connection(shard).execute(
+                f'SELECT l.phone_number, l.principal / {MINOR_UNITS}.0, l.annual_rate, l.term_months, l.start_ts, '
+                f'a.loan_amount / {MINOR_UNITS}.0 '
+                f'FROM loans l JOIN accounts a USING (phone_number)')
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    portfolio.append(*row)
+        return portfolio
+
+    def payments(self) -> array:
+        return array('d', map(monthly_payment, self.principals, self.annual_rates, self.terms))
+
+    def next_due(self, now: float = None) -> array:
+        now = time.time() if now is None else now
+        return array('d', map(next_installment, self.principals, self.annual_rates, self.terms, self.start_times,
+                              self.outstanding, [now] * len(self)))
+
+    def arrears(self, now: float = None) -> array:
+        now = time.time() if now is None else now
+        return array('d', (max(outstanding - scheduled_balance(principal, rate, term, elapsed_periods(start, now)), 0.0)
+                           for principal, rate, term, start, outstanding
+                           in zip(self.principals, self.annual_rates, self.terms, self.start_times, self.outstanding)))
+
+    def schedule(self, index: int) -> tuple:
+        return amortization_schedule(self.principals[index], self.annual_rates[index], self.terms[index])
+
+    def __len__(self) -> int:
+        return len(self.phone_numbers)
@@ -0,0 +1,188 @@
+import functools
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+SUB_BUCKETS = 8
+OCTAVES = 40
+
+
+class Histogram:
+    # HDR-style log-linear buckets over microseconds: 8 per power of two, so any reading is within 12.5%
+    __slots__ = ('counts', 'count', 'errors', 'total', 'max', '_lock')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self.counts = [0] * (SUB_BUCKETS * OCTAVES)
+            self.count = 0
+            self.errors = 0
+            self.total = 0.0
+            self.max = 0.0
+
+    @staticmethod
+    def bucket(seconds: float) -> int:
+        mantissa, exponent = math.frexp(seconds * 1e6)
+        if exponent <= 0:
+            return 0
+        return min(exponent * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS), SUB_BUCKETS * OCTAVES - 1)
+
+    @staticmethod
+    def upper_bound(index: int) -> float:
+        exponent, sub = divmod(index, SUB_BUCKETS)
+        return (0.5 + (sub + 1) / (2 * SUB_BUCKETS)) * 2 ** exponent / 1e6
+
+    def record(self, seconds: float, error: bool = False) -> None:
+        index = self.bucket(seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+            if error:
+                self.errors += 1
+
+    def percentile(self, fraction: float) -> float:
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(self.upper_bound(index), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'sum_seconds': round(self.total, 6),
+            'p50_ms': round(self.percentile(0.50) * 1000, 3),
+            'p95_ms': round(self.percentile(0.95) * 1000, 3),
+            'p99_ms': round(self.percentile(0.99) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str) -> Histogram:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def observe(self, name: str, seconds: float, error: bool = False) -> None:
+        if self.enabled:
+            self.histogram(name).record(seconds, error)
+
+    def timed(self, name: str):
+        def decorator(fn):
+            histogram = self.histogram(name)
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException:
+                    histogram.record(time.perf_counter() - start, True)
+                    raise
+                if isinstance(result, Future):
+                    # ledger operations: the time that matters is until the commit, and an error string is a failure
+                    result.add_done_callback(lambda f: histogram.record(
+                        time.perf_counter() - start, f.exception() is not None or isinstance(f.result(), str)))
+                else:
+                    histogram.record(time.perf_counter() - start)
+                return result
+            return wrapper
+        return decorator
+
+    @contextmanager
+    def timer(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.histogram(name).record(time.perf_counter() - start, True)
+            raise
+        self.histogram(name).record(time.perf_counter() - start)
+
+    def reset(self) -> None:
+        # histograms are cleared in place; decorated functions keep a reference to theirs
+        for histogram in list(self.histograms.values()):
+            histogram.clear()
+
+    def to_json(self) -> dict:
+        return {name: histogram.summary() for name, histogram in sorted(self.histograms.items()) if histogram.count}
+
+    def to_prometheus(self) -> str:
+        lines = ['# TYPE banking_operation_seconds histogram']
+        errors = ['# TYPE banking_operation_errors_total counter']
+        for name, histogram in sorted(self.histograms.items()):
+            if not histogram.count:
+                continue
+            label = f'operation="{name}"'
+            cumulative = 0
+            for index, count in enumerate(histogram.counts):
+                if count:
+                    cumulative += count
+                    lines.append(f'banking_operation_seconds_bucket{{{label},le="{histogram.upper_bound(index):.9g}"}} '
+                                 f'{cumulative}')
+            lines.append(f'banking_operation_seconds_bucket{{{label},le="+Inf"}} {histogram.count}')
+            lines.append(f'banking_operation_seconds_sum{{{label}}} {histogram.total:.9g}')
+            lines.append(f'banking_operation_seconds_count{{{label}}} {histogram.count}')
+            errors.append(f'banking_operation_errors_total{{{label}}} {histogram.errors}')
+        return '\n'.join(lines + errors) + '\n'
+
+    def dump(self, path: str) -> None:
+        # written beside the target and renamed over it, so a scraper never sees half a file
+        text = json.dumps(self.to_json(), indent=2) if path.endswith('.json') else self.to_prometheus()
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as f:
+            f.write(text)
+        os.replace(temporary, path)
+
+
+class MetricsDumper:
+    def __init__(self, registry: MetricsRegistry, path: str, interval: float = 10.0):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='metrics-dump', daemon=True)
+
+    def start(self) -> 'MetricsDumper':
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.registry.dump(self.path)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.registry.dump(self.path)
+
+
+metrics = MetricsRegistry()
+timed = metrics.timed
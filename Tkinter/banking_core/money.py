@@ -0,0 +1,71 @@
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+MINOR_UNITS = 100
+CENTS = Decimal('0.01')
+# the largest amount from_taka accepts, in poisha: ten trillion taka, far enough below the int64 limit that
+# SQLite's integer arithmetic on balances never overflows into REAL
+MAX_AMOUNT = 10 ** 15
+
+
+class Money(int):
+    # an exact amount in poisha; it is an int, so sqlite3 binds it and SUM() adds it without conversion.
+    # Arithmetic with plain ints treats them as poisha too; taka only come in through from_taka.
+    __slots__ = ()
+
+    @classmethod
+    def from_taka(cls, value) -> 'Money':
+        # plain numbers and strings are taka, rounded half-up to the poisha; a Money passes through unchanged
+        if isinstance(value, Money):
+            return value
+        if isinstance(value, int) and not isinstance(value, bool):
+            money = cls(value * MINOR_UNITS)
+        else:
+            try:
+                money = cls(Decimal(str(value)).quantize(CENTS, ROUND_HALF_UP) * MINOR_UNITS)
+            except (InvalidOperation, ValueError, TypeError):
+                raise ValueError(f"invalid amount {value!r}") from None
+        if abs(money) > MAX_AMOUNT:
+            raise ValueError(f"amount {value!r} exceeds {cls(MAX_AMOUNT)} Tk/=")
+        return money
+
+    @property
+    def taka(self) -> float:
+        return self / MINOR_UNITS
+
+    def __add__(self, other):
+        return Money(int(self) + other) if isinstance(other, int) else NotImplemented
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return Money(int(self) - other) if isinstance(other, int) else NotImplemented
+
+    def __rsub__(self, other):
+        return Money(other - int(self)) if isinstance(other, int) else NotImplemented
+
+    def __neg__(self):
+        return Money(-int(self))
+
+    def __abs__(self):
+        return Money(abs(int(self)))
+
+    def __mul__(self, factor):
+        # a rate times an amount, e.g. interest, rounds to the nearest poisha
+        if isinstance(factor, (int, float)):
+            return Money(round(int(self) * factor))
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __str__(self) -> str:
+        whole, poisha = divmod(abs(int(self)), MINOR_UNITS)
+        return f"{'-' if self < 0 else ''}{whole}.{poisha:02d}"
+
+    def __repr__(self) -> str:
+        return f"Money('{self}')"
+
+    def __format__(self, spec: str) -> str:
+        # float presentation types format the taka value; anything else pads the exact string
+        if spec and spec[-1] in 'eEfFgG%':
+            return format(self.taka, spec)
+        return format(str(self), spec)
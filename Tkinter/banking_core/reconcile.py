@@ -0,0 +1,107 @@
+import csv
+import json
+import os
+import time
+
+from .db import db_pool
+from .money import Money
+
+SELECT_BALANCES = 'SELECT phone_number, balance FROM accounts WHERE phone_number > ? ORDER BY phone_number LIMIT ?'
+# both walk the primary-key / (phone_number, ts, id) indexes in order, so SQLite streams without sorting
+SELECT_LEDGER_TOTALS = ('SELECT phone_number, SUM(amount) FROM transactions WHERE phone_number > ? AND phone_number <= ? '
+                        'GROUP BY phone_number ORDER BY phone_number')
+SELECT_LEDGER_TOTALS_TAIL = ('SELECT phone_number, SUM(amount) FROM transactions WHERE phone_number > ? '
+                             'GROUP BY phone_number ORDER BY phone_number')
+REPORT_COLUMNS = ('shard', 'phone_number', 'balance', 'ledger_total', 'difference')
+# amounts are integer poisha, so a correct book matches exactly
+TOLERANCE = 0
+
+
+def merge_join(balances, totals):
+    # both inputs are (phone_number, amount) in phone_number order; yields every key with a missing side as None
+    balances, totals = iter(balances), iter(totals)
+    balance = next(balances, None)
+    total = next(totals, None)
+    while balance is not None or total is not None:
+        if total is None or (balance is not None and balance[0] < total[0]):
+            yield balance[0], balance[1], None
+            balance = next(balances, None)
+        elif balance is None or total[0] < balance[0]:
+            yield total[0], None, total[1]
+            total = next(totals, None)
+        else:
+            yield balance[0], balance[1], total[1]
+            balance = next(balances, None)
+            total = next(totals, None)
+
+
+class Reconciler:
+    def __init__(self, report_path: str, checkpoint_path: str = None, batch_size: int = 100000,
+                 tolerance: int = TOLERANCE):
+        # every account's balance must equal the sum of its ledger rows; mismatches are appended to report_path
+        self.report_path = report_path
+        self.checkpoint_path = checkpoint_path or f'{report_path}.checkpoint'
+        self.batch_size = batch_size
+        self.tolerance = tolerance
+        self.state = {'shard': 0, 'after': '', 'accounts': 0, 'mismatches': 0, 'balance_total': 0,
+                      'ledger_total': 0, 'seconds': 0.0}
+
+    def run(self, restart: bool = False) -> dict:
+        resumed = not restart and os.path.exists(self.checkpoint_path)
+        if resumed:
+            with open(self.checkpoint_path) as f:
+                self.state = json.load(f)
+        with open(self.report_path, 'a' if resumed else 'w', newline='') as report:
+            writer = csv.writer(report)
+            if not resumed:
+                writer.writerow(REPORT_COLUMNS)
+            start = time.perf_counter() - self.state['seconds']
+            while self.state['shard'] < db_pool.shards:
+                done = self._batch(writer)
+                # the report is flushed before the checkpoint moves past its rows, so a resume never loses one
+                report.flush()
+                self.state['seconds'] = time.perf_counter() - start
+                if done:
+                    self.state['shard'] += 1
+                    self.state['after'] = ''
+                self._save()
+        os.remove(self.checkpoint_path)
+        return dict(self.state, balance_total=Money(self.state['balance_total']),
+                    ledger_total=Money(self.state['ledger_total']), resumed=resumed)
+
+    def _batch(self, writer) -> bool:
+        # one read snapshot per batch: a balance and its ledger rows are always seen together, and the WAL can still
+        # be checkpointed between batches
+        shard, after = self.state['shard'], self.state['after']
+        with db_pool.snapshot(shard) as conn:
+            balances = conn.execute(SELECT_BALANCES, (after, self.batch_size)).fetchall()
+            done = len(balances) < self.batch_size
+            if done:
+                totals = conn.execute(SELECT_LEDGER_TOTALS_TAIL, (after,))
+            else:
+                totals = conn.execute(SELECT_LEDGER_TOTALS, (after, balances[-1][0]))
+            for phone_number, balance, total in merge_join(balances, totals):
+                balance_value, total_value = balance or 0, total or 0
+                if balance is not None:
+                    self.state['accounts'] += 1
+                self.state['balance_total'] += balance_value
+                self.state['ledger_total'] += total_value
+                # a missing balance means ledger rows without an account
+                if balance is None or abs(balance_value - total_value) > self.tolerance:
+                    self.state['mismatches'] += 1
+                    writer.writerow((shard, phone_number, '' if balance is None else Money(balance),
+                                     '' if total is None else Money(total), Money(balance_value - total_value)))
+        if balances:
+            self.state['after'] = balances[-1][0]
+        return done
+
+    def _save(self) -> None:
+        temporary = f'{self.checkpoint_path}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(temporary, self.checkpoint_path)
+
+
+def reconcile_balances(report_path: str, checkpoint_path: str = None, batch_size: int = 100000,
+                       restart: bool = False) -> dict:
+    return Reconciler(report_path, checkpoint_path, batch_size).run(restart)
@@ -0,0 +1,65 @@
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from .metrics import timed
+
+PIN_SCRYPT_N = 2 ** 14
+PIN_SCRYPT_R = 8
+PIN_SCRYPT_P = 1
+
+
+def _derive_pin_hash(pin: str, salt: str, n: int, r: int, p: int) -> str:
+    return hashlib.scrypt(pin.encode(), salt=bytes.fromhex(salt), n=n, r=r, p=p).hex()
+
+
+def hash_pin(pin: str, n: int = PIN_SCRYPT_N, r: int = PIN_SCRYPT_R, p: int = PIN_SCRYPT_P) -> str:
+    # salt and cost parameters are stored with the hash so they can be raised per row later
+    salt = os.urandom(16).hex()
+    return f"scrypt${n}${r}${p}${salt}${_derive_pin_hash(pin, salt, n, r, p)}"
+
+
+def verify_pin(pin: str, pin_hash: str) -> bool:
+    if not pin_hash:
+        return False
+    if not pin_hash.startswith('scrypt$'):
+        return hmac.compare_digest(pin_hash, hashlib.sha256(pin.encode()).hexdigest())
+    _, n, r, p, salt, expected = pin_hash.split('$')
+    return hmac.compare_digest(_derive_pin_hash(pin, salt, int(n), int(r), int(p)), expected)
+
+
+def pin_needs_rehash(pin_hash: str) -> bool:
+    return not pin_hash.startswith(f"scrypt${PIN_SCRYPT_N}${PIN_SCRYPT_R}${PIN_SCRYPT_P}$")
+
+
+class PinHasher:
+    def __init__(self, max_workers: int = None):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # forking copies whatever locks the front-end's threads (writers, Tk, the RPC loop) hold at that
+                # moment; spawned workers start clean and only import this module
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    @timed('pin.hash')
+    def hash(self, pin: str) -> str:
+        return self._pool().submit(hash_pin, pin).result()
+
+    @timed('pin.verify')
+    def verify(self, pin: str, pin_hash: str) -> bool:
+        return self._pool().submit(verify_pin, pin, pin_hash).result()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
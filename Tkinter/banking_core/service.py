@@ -0,0 +1,334 @@
+import asyncio
+import json
+import secrets
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from .cache import AccountCache
+from .db import ACCOUNT_TYPES
+from .metrics import metrics
+from .money import MAX_AMOUNT, Money
+from .system import MobileBankingSystemController
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+APPLICATION_ERROR = -32000
+
+MAX_BODY_SIZE = 64 * 1024
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large'}
+
+
+class RpcError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class AccountLocks:
+    def __init__(self):
+        # phone_number -> [lock, holders + waiters]; entries are dropped once nobody references them
+        self._locks = {}
+
+    @asynccontextmanager
+    async def hold(self, *phone_numbers):
+        # several accounts are always locked in sorted order so two transfers can't deadlock
+        entries = []
+        for phone_number in sorted(set(phone_numbers)):
+            entry = self._locks.setdefault(phone_number, [asyncio.Lock(), 0])
+            entry[1] += 1
+            entries.append((phone_number, entry))
+        acquired = []
+        try:
+            for _, entry in entries:
+                await entry[0].acquire()
+                acquired.append(entry[0])
+            yield
+        finally:
+            for lock in acquired:
+                lock.release()
+            for phone_number, entry in entries:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[phone_number]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+class BankingService:
+    def __init__(self, controller: MobileBankingSystemController, max_workers: int = 16, max_pending: int = 1024,
+                 session_ttl: float = 900.0, max_sessions: int = 100000):
+        self.controller = controller
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='rpc')
+        self.max_pending = max_pending
+        self.sessions = AccountCache(max_sessions, session_ttl)
+        self.locks = AccountLocks()
+        self.requests = 0
+        self.errors = 0
+        self._slots = None
+        self._server = None
+        self._connections = {}
+        self.methods = {
+            'create_account': self.create_account,
+            'login': self.login,
+            'logout': self.logout,
+            'deposit': self.deposit,
+            'withdraw': self.withdraw,
+            'transfer': self.transfer,
+            'balance': self.balance,
+        }
+
+    async def _call(self, fn, *args):
+        # DB and hashing work runs on a fixed pool; at most max_pending calls may be queued for it at once
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        async with self._slots:
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+            if isinstance(result, Future):
+                # money operations hand back a ledger future; answer once it is committed
+                result = await asyncio.wrap_future(result)
+            return result
+
+    def _session(self, token):
+        account = self.sessions.get(token) if isinstance(token, str) else None
+        if account is None:
+            raise RpcError(APPLICATION_ERROR, "Invalid or expired session token.")
+        return account
+
+    @staticmethod
+    def _amount(amount) -> Money:
+        # the wire carries taka; anything that rounds to less than a poisha, or is above MAX_AMOUNT, is not an amount
+        try:
+            money = None if isinstance(amount, bool) or not isinstance(amount, (int, float)) else Money.from_taka(amount)
+        except ValueError:
+            money = None
+        if money is None or money <= 0:
+            raise RpcError(INVALID_PARAMS, f"amount must be a positive number of at most {Money(MAX_AMOUNT)}.")
+        return money
+
+    @staticmethod
+    def _key(idempotency_key):
+        if idempotency_key is not None and (not isinstance(idempotency_key, str) or len(idempotency_key) > 128):
+            raise RpcError(INVALID_PARAMS, "idempotency_key must be a string of at most 128 characters.")
+        return idempotency_key
+
+    @staticmethod
+    def _phone_number(phone_number) -> str:
+        if not isinstance(phone_number, str) or not phone_number.strip():
+            raise RpcError(INVALID_PARAMS, "phone_number must be a non-empty string.")
+        return phone_number.strip()
+
+    async def create_account(self, phone_number, pin, account_type='mobile', name=None, interest_rate=None,
+                             loan_amount=None, policy_number=None) -> dict:
+        phone_number = self._phone_number(phone_number)
+        if not isinstance(pin, str) or not pin:
+            raise RpcError(INVALID_PARAMS, "pin must be a non-empty string.")
+        if account_type not in ACCOUNT_TYPES:
+            raise RpcError(INVALID_PARAMS, f"account_type must be one of {', '.join(ACCOUNT_TYPES)}.")
+        async with self.locks.hold(phone_number):
+            created = await self._call(lambda: self.controller.create_account(
+                phone_number, pin, account_type, name, interest_rate=interest_rate, loan_amount=loan_amount,
+                policy_number=policy_number))
+        if not created:
+            raise RpcError(APPLICATION_ERROR, "Mobile number already registered.")
+        return {'phone_number': phone_number, 'account_type': account_type}
+
+    async def login(self, phone_number, pin) -> dict:
+        phone_number = self._phone_number(phone_number)
+        async with self.locks.hold(phone_number):
+            account = await self._call(self.controller.login, phone_number, str(pin))
+        if account is None:
+            raise RpcError(APPLICATION_ERROR, "Invalid mobile number or pin.")
+        token = secrets.token_urlsafe(24)
+        self.sessions[token] = account
+        return {'token': token, 'account_type': account.account_type, 'balance': account.balance.taka}
+
+    async def logout(self, token) -> dict:
+        self._session(token)
+        self.sessions.invalidate(token)
+        return {'logged_out': True}
+
+    async def deposit(self, token, amount, idempotency_key=None) -> dict:
+        account = self._session(token)
+        amount = self._amount(amount)
+        async with self.locks.hold(account.phone_number):
+            error = await self._call(self.controller.deposit, account, amount, self._key(idempotency_key))
+        if error is not None:
+            raise RpcError(APPLICATION_ERROR, error)
+        return {'balance': account.balance.taka}
+
+    async def withdraw(self, token, amount, idempotency_key=None) -> dict:
+        account = self._session(token)
+        amount = self._amount(amount)
+        async with self.locks.hold(account.phone_number):
+            error = await self._call(self.controller.withdraw, account, amount, self._key(idempotency_key))
+        if error is not None:
+            raise RpcError(APPLICATION_ERROR, error)
+        return {'balance': account.balance.taka}
+
+    async def transfer(self, token, target_phone_number, amount, idempotency_key=None) -> dict:
+        account = self._session(token)
+        target_phone_number = self._phone_number(target_phone_number)
+        amount = self._amount(amount)
+        target_account = await self._call(self.controller.find_account, target_phone_number)
+        if target_account is None:
+            raise RpcError(APPLICATION_ERROR, "Target account not found.")
+        async with self.locks.hold(account.phone_number, target_phone_number):
+            error = await self._call(self.controller.transfer, account, target_account, amount,
+                                     self._key(idempotency_key))
+        if error is not None:
+            raise RpcError(APPLICATION_ERROR, error)
+        return {'balance': account.balance.taka}
+
+    async def balance(self, token) -> dict:
+        account = self._session(token)
+        return {'phone_number': account.phone_number, 'balance': account.balance.taka}
+
+    async def dispatch(self, request) -> dict:
+        request_id = request.get('id') if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict) or request.get('jsonrpc') != '2.0' or 'method' not in request:
+                raise RpcError(INVALID_REQUEST, "Invalid request.")
+            method = self.methods.get(request['method'])
+            if method is None:
+                raise RpcError(METHOD_NOT_FOUND, f"Unknown method {request['method']!r}.")
+            params = request.get('params', {})
+            try:
+                with metrics.timer(f"rpc.{request['method']}"):
+                    if isinstance(params, dict):
+                        result = await method(**params)
+                    elif isinstance(params, list):
+                        result = await method(*params)
+                    else:
+                        raise RpcError(INVALID_PARAMS, "params must be an object or an array.")
+            except TypeError as e:
+                raise RpcError(INVALID_PARAMS, str(e))
+            return {'jsonrpc': '2.0', 'result': result, 'id': request_id}
+        except RpcError as e:
+            self.errors += 1
+            return {'jsonrpc': '2.0', 'error': {'code': e.code, 'message': e.message}, 'id': request_id}
+        except Exception as e:
+            self.errors += 1
+            return {'jsonrpc': '2.0', 'error': {'code': APPLICATION_ERROR, 'message': str(e)}, 'id': request_id}
+
+    async def handle_body(self, body: bytes):
+        self.requests += 1
+        try:
+            request = json.loads(body)
+        except ValueError:
+            self.errors += 1
+            return {'jsonrpc': '2.0', 'error': {'code': PARSE_ERROR, 'message': "Parse error."}, 'id': None}
+        if isinstance(request, list):
+            if not request:
+                return await self.dispatch(None)
+            return list(await asyncio.gather(*(self.dispatch(item) for item in request)))
+        return await self.dispatch(request)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # minimal HTTP/1.1: POST / with a JSON-RPC body, keep-alive unless the client asks to close
+        self._connections[asyncio.current_task()] = writer
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, _, rest = request_line.decode('latin-1').partition(' ')
+                path = rest.split(' ', 1)[0]
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                length = int(headers.get('content-length') or 0)
+                if length > MAX_BODY_SIZE:
+                    await self._respond(writer, 413, b'', False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                if path != '/':
+                    await self._respond(writer, 404, b'', keep_alive)
+                elif method != 'POST':
+                    await self._respond(writer, 405, b'', keep_alive)
+                else:
+                    response = await self.handle_body(body)
+                    await self._respond(writer, 200, json.dumps(response).encode(), keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            del self._connections[asyncio.current_task()]
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, body: bytes, keep_alive: bool) -> None:
+        writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                     .encode('latin-1') + body)
+        await writer.drain()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8080, backlog: int = 4096) -> asyncio.AbstractServer:
+        self._server = await asyncio.start_server(self.handle_connection, host, port, backlog=backlog)
+        return self._server
+
+    async def serve_forever(self, host: str = '127.0.0.1', port: int = 8080) -> None:
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        # idle keep-alive connections see EOF and their handlers return on their own
+        for writer in list(self._connections.values()):
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        self.executor.shutdown(wait=False)
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+
+class RpcClient:
+    # one keep-alive HTTP connection to a BankingService; used by the load test as a stand-in terminal
+    def __init__(self, host: str = '127.0.0.1', port: int = 8080):
+        self.host = host
+        self.port = port
+        self._reader = None
+        self._writer = None
+        self._next_id = 0
+
+    async def connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+
+    async def call(self, method: str, **params):
+        self._next_id += 1
+        body = json.dumps({'jsonrpc': '2.0', 'method': method, 'params': params, 'id': self._next_id}).encode()
+        self._writer.write(f"POST / HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+                           f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body)
+        await self._writer.drain()
+        await self._reader.readline()
+        length = 0
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            if key.strip().lower() == 'content-length':
+                length = int(value)
+        response = json.loads(await self._reader.readexactly(length))
+        if 'error' in response:
+            raise RpcError(response['error']['code'], response['error']['message'])
+        return response['result']
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
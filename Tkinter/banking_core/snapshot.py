@@ -0,0 +1,137 @@
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+
+from .accounts import AccountTable, build_account
+from .db import ACCOUNT_COLUMNS, ACCOUNT_TYPES, db_pool
+
+MAGIC = b'BANKSNAP'
+FORMAT_VERSION = 1
+# magic, format version, shard count, written at (unix time), account count; then one high-water mark per shard
+HEADER = struct.Struct('<8sHHdQ')
+# balance, loan_amount, version, interest_rate, account type, optional-field flags, then the lengths of the
+# phone_number, pin_hash, name and policy_number bytes that follow the fixed part
+RECORD = struct.Struct('<qqqdBB4H')
+HAS_INTEREST_RATE, HAS_NAME, HAS_POLICY_NUMBER = 1, 2, 4
+SELECT_HIGH_WATER_MARK = 'SELECT COALESCE(MAX(id), 0) FROM transactions'
+SELECT_SNAPSHOT_ACCOUNTS = f'SELECT {", ".join(ACCOUNT_COLUMNS)}, version FROM accounts WHERE phone_number IN '
+# transactions.id is the rowid, so the tail past a mark is a range scan however long the ledger is
+SELECT_LEDGER_TAIL = 'SELECT phone_number, SUM(amount), COUNT(*) FROM transactions WHERE id > ? GROUP BY phone_number'
+
+
+def _pack(row) -> bytes:
+    phone_number, balance, pin_hash, account_type, interest_rate, loan_amount, policy_number, name, version = row
+    flags = ((HAS_INTEREST_RATE if interest_rate is not None else 0) | (HAS_NAME if name is not None else 0)
+             | (HAS_POLICY_NUMBER if policy_number is not None else 0))
+    strings = [value.encode() for value in (phone_number, pin_hash, name or '', policy_number or '')]
+    return RECORD.pack(balance or 0, loan_amount or 0, version, interest_rate or 0.0,
+                       AccountTable.TYPE_CODES.get(account_type, 0), flags, *map(len, strings)) + b''.join(strings)
+
+
+def write_snapshot(cache, path: str, chunk_size: int = 500) -> int:
+    # the rows come from the database, not the cached objects, so only committed state is written, and each
+    # shard's rows and high-water mark are read in one snapshot so they agree with each other
+    phone_numbers = cache.keys()
+    by_shard = [[] for _ in range(db_pool.shards)]
+    for phone_number in phone_numbers:
+        by_shard[db_pool.shard_of(phone_number)].append(phone_number)
+    marks = array('q', bytes(8 * db_pool.shards))
+    records = {}
+    for shard, numbers in enumerate(by_shard):
+        with db_pool.snapshot(shard) as conn:
+            marks[shard] = conn.execute(SELECT_HIGH_WATER_MARK).fetchone()[0]
+            for start in range(0, len(numbers), chunk_size):
+                chunk = numbers[start:start + chunk_size]
+                for row in conn.execute(SELECT_SNAPSHOT_ACCOUNTS + f'({", ".join("?" * len(chunk))})', chunk):
+                    records[row[0]] = _pack(row)
+    # least recently used first, so loading into a smaller cache keeps the hottest accounts
+    body = [records[phone_number] for phone_number in phone_numbers if phone_number in records]
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, db_pool.shards, time.time(), len(body)))
+        f.write(marks.tobytes())
+        f.writelines(body)
+    os.replace(temporary, path)
+    return len(body)
+
+
+def _unpack(view, offset: int):
+    (balance, loan_amount, version, interest_rate, type_code, flags, phone_length, pin_hash_length, name_length,
+     policy_number_length) = RECORD.unpack_from(view, offset)
+    offset += RECORD.size
+    phone_number = view[offset:offset + phone_length].decode()
+    offset += phone_length
+    pin_hash = view[offset:offset + pin_hash_length].decode()
+    offset += pin_hash_length
+    name = view[offset:offset + name_length].decode()
+    offset += name_length
+    policy_number = view[offset:offset + policy_number_length].decode()
+    offset += policy_number_length
+    account = build_account(phone_number, balance, pin_hash, ACCOUNT_TYPES[type_code],
+                            interest_rate if flags & HAS_INTEREST_RATE else None, loan_amount,
+                            policy_number if flags & HAS_POLICY_NUMBER else None, name if flags & HAS_NAME else None,
+                            version)
+    return account, offset
+
+
+def load_snapshot(cache, path: str) -> dict:
+    # warm start: rebuild the cached accounts from the snapshot, then bring them up to date by replaying only the
+    # ledger rows committed after it. A snapshot that doesn't fit this database raises ValueError.
+    start = time.perf_counter()
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        if len(view) < HEADER.size:
+            raise ValueError(f"{path} is not a snapshot")
+        magic, format_version, shards, written_at, count = HEADER.unpack_from(view)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} snapshot")
+        if shards != db_pool.shards:
+            raise ValueError(f"snapshot was taken with {shards} shards, the database has {db_pool.shards}")
+        marks = array('q')
+        marks.frombytes(view[HEADER.size:HEADER.size + 8 * shards])
+        offset = HEADER.size + 8 * shards
+        accounts = {}
+        for _ in range(count):
+            account, offset = _unpack(view, offset)
+            accounts[account.phone_number] = account
+    replayed = 0
+    for shard, mark in enumerate(marks):
+        with db_pool.snapshot(shard) as conn:
+            if conn.execute(SELECT_HIGH_WATER_MARK).fetchone()[0] < mark:
+                raise ValueError(f"shard {shard} is older than the snapshot")
+            for phone_number, amount, events in conn.execute(SELECT_LEDGER_TAIL, (mark,)):
+                replayed += events
+                account = accounts.get(phone_number)
+                if account is not None:
+                    # every ledger row moved the balance by its amount and bumped the version once; a loan repayment
+                    # leaves no ledger row, so its loan amount stays stale until the version check reloads it
+                    account.balance += amount
+                    account.version += events
+    cache.put_many(accounts.items())
+    return {'accounts': len(accounts), 'replayed': replayed, 'age': time.time() - written_at,
+            'seconds': time.perf_counter() - start}
+
+
+class SnapshotWriter:
+    def __init__(self, cache, path: str, interval: float = 300.0):
+        self.cache = cache
+        self.path = path
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='snapshot-writer', daemon=True)
+
+    def start(self) -> 'SnapshotWriter':
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            write_snapshot(self.cache, self.path)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        write_snapshot(self.cache, self.path)
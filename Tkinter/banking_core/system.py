@@ -0,0 +1,368 @@
+import atexit
+import heapq
+import math
+import os
+import random
+import sqlite3
+import time
+from concurrent.futures import Future
+from itertools import compress
+
+from .accounts import AccountTable, InsuranceAccount, LoanAccount, MobileMoneyAccount, SavingsAccount, build_account
+from .cache import account_cache
+from .db import (ACCOUNT_TYPES, DEFAULT_LOAN_RATE, DEFAULT_LOAN_TERM_MONTHS, DEFAULT_POLICY_COVERAGE,
+                 DEFAULT_POLICY_PER_CLAIM, account_directory, create_account_in_db, create_loan_in_db,
+                 create_policy_in_db, db_pool, get_account_from_db, get_loan_from_db, get_policy_holder_from_db,
+                 get_statement_page, initialize_database, registered_numbers_filter, transfer_many_in_db,
+                 update_account_in_db, update_pin_hash_in_db)
+from .idempotency import IdempotencyCache
+from .ledger import LedgerWriter, completed_future, then
+from .loans import loan_schedule, next_installment
+from .metrics import timed
+from .money import Money
+from .security import PinHasher, pin_needs_rehash
+from .snapshot import load_snapshot
+from .velocity import VelocityTracker
+
+
+class MobileBankingSystem:
+    def __init__(self, pin_hasher: PinHasher = None, snapshot_path: str = None,
+                 registration_false_positive_rate: float = 0.01):
+        self.accounts = account_cache
+        self.pin_hasher = pin_hasher or PinHasher()
+        atexit.register(self.pin_hasher.close)
+        initialize_database()
+        self.registration_false_positive_rate = registration_false_positive_rate
+        self.registered = registered_numbers_filter(registration_false_positive_rate)
+        self.warm_start = None
+        if snapshot_path is not None and os.path.exists(snapshot_path):
+            try:
+                self.warm_start = load_snapshot(self.accounts, snapshot_path)
+            except ValueError as e:
+                # a stale or foreign snapshot only costs the warm start; accounts still load lazily
+                print(f"Ignoring snapshot: {e}")
+
+    def create_account(self, phone_number: str, pin: str, account_type: str, name: str = None, **kwargs) -> bool:
+        # only a number the filter may have seen costs a SELECT; a new one goes straight to the insert
+        if phone_number in self.registered and get_account_from_db(phone_number) is not None:
+            print("Mobile number already registered.")
+            return False
+        else:
+            pin_hash = self.pin_hasher.hash(pin)
+            balance = 0
+            interest_rate = kwargs.get('interest_rate')
+            loan_amount = None if kwargs.get('loan_amount') is None else Money.from_taka(kwargs['loan_amount'])
+            policy_number = kwargs.get('policy_number')
+            try:
+                # the account and its loan or policy commit together, so a rejected policy leaves nothing behind
+                with db_pool.transaction(db_pool.shard_of(phone_number)):
+                    if account_type == 'insurance' and policy_number and get_policy_holder_from_db(policy_number):
+                        print("Policy number already registered.")
+                        return False
+                    create_account_in_db(phone_number, balance, pin_hash, account_type, interest_rate, loan_amount,
+                                         policy_number, name)
+                    if account_type == 'loan' and loan_amount:
+                        create_loan_in_db(phone_number, loan_amount, kwargs.get('loan_rate', DEFAULT_LOAN_RATE),
+                                          kwargs.get('loan_term_months', DEFAULT_LOAN_TERM_MONTHS))
+                    if account_type == 'insurance' and policy_number:
+                        create_policy_in_db(phone_number, policy_number,
+                                            Money.from_taka(kwargs.get('coverage_limit', DEFAULT_POLICY_COVERAGE)),
+                                            Money.from_taka(kwargs.get('per_claim_limit', DEFAULT_POLICY_PER_CLAIM)))
+            except sqlite3.IntegrityError as e:
+                if 'policies' in str(e):
+                    # taken in this shard by a registration that raced ours
+                    print("Policy number already registered.")
+                    return False
+                # registered since the filter was built, by another process or a bulk import
+                self.registered.add(phone_number)
+                print("Mobile number already registered.")
+                return False
+            self._remember_registration(phone_number)
+            self.accounts[phone_number] = build_account(phone_number, balance, pin_hash, account_type, interest_rate,
+                                                        loan_amount, policy_number, name)
+            print(f"{phone_number} {account_type} account created successfully.")
+            return True
+
+    def _remember_registration(self, phone_number: str) -> None:
+        self.registered.add(phone_number)
+        if len(self.registered) > self.registered.capacity:
+            # past its capacity the false-positive rate climbs, so rebuild it with fresh headroom
+            self.registered = registered_numbers_filter(self.registration_false_positive_rate)
+
+    def login(self, phone_number: str, pin: str) -> MobileMoneyAccount:
+        account = self.accounts.get(phone_number)
+        if account is None:
+            account_data = get_account_from_db(phone_number)
+            if account_data:
+                account = build_account(*account_data)
+        if account is not None and self.pin_hasher.verify(pin, account.pin_hash):
+            if pin_needs_rehash(account.pin_hash):
+                # legacy unsalted sha256 row: upgrade now that we know the PIN
+                account.pin_hash = self.pin_hasher.hash(pin)
+                update_pin_hash_in_db(phone_number, account.pin_hash)
+            self.accounts[phone_number] = account
+            print(f"{phone_number} logged in successfully.")
+            return account
+        print("Invalid mobile number or pin.")
+        return None
+
+
+class MobileBankingSystemController:
+    def __init__(self, mobile_banking_system: MobileBankingSystem, velocity_limits: dict = None):
+        self.mobile_banking_system = mobile_banking_system
+        self.velocity = VelocityTracker(velocity_limits)
+        self.idempotency = IdempotencyCache()
+        self.account_manager = AccountManager()
+        self.ledger_writer = LedgerWriter()
+        atexit.register(self.ledger_writer.close)
+        self.max_update_retries = 8
+        self.update_retries = 0
+        self.update_conflicts = 0
+
+    @timed('controller.create_account')
+    def create_account(self, phone_number: str, pin: str, account_type: str, name: str = None, **kwargs) -> bool:
+        return self.mobile_banking_system.create_account(phone_number, pin, account_type, name, **kwargs)
+
+    @timed('controller.login')
+    def login(self, phone_number: str, pin: str) -> MobileMoneyAccount:
+        return self.mobile_banking_system.login(phone_number, pin)
+
+    @timed('controller.deposit')
+    def deposit(self, account: MobileMoneyAccount, amount: float, idempotency_key: str = None) -> Future:
+        # amounts arrive in taka (or as Money) and are exact poisha from here on
+        amount = Money.from_taka(amount)
+        return self.idempotency.run(idempotency_key, lambda: self._deposit(account, amount, idempotency_key),
+                                    account.phone_number)
+
+    def _deposit(self, account: MobileMoneyAccount, amount: Money, idempotency_key: str) -> Future:
+        account.deposit(amount)
+        future = self.ledger_writer.submit('deposit', account.phone_number, amount, idempotency_key=idempotency_key)
+        return then(future, lambda error: self._undo_if_rejected(error, account, -amount, future.replayed))
+
+    @timed('controller.withdraw')
+    def withdraw(self, account: MobileMoneyAccount, amount: float, idempotency_key: str = None) -> Future:
+        amount = Money.from_taka(amount)
+        return self.idempotency.run(idempotency_key, lambda: self._withdraw(account, amount, idempotency_key),
+                                    account.phone_number)
+
+    def _withdraw(self, account: MobileMoneyAccount, amount: Money, idempotency_key: str) -> Future:
+        # a non-positive amount must not reach the velocity windows, where it would offset earlier withdrawals
+        if amount <= 0:
+            return completed_future("Invalid withdrawal amount.")
+        error = self.velocity.admit(account.phone_number, account.account_type, amount)
+        if error is not None:
+            return completed_future(error)
+        balance = account.balance
+        account.withdraw(amount)
+        if account.balance == balance:
+            return completed_future("You don't have enough funds to withdraw.")
+        future = self.ledger_writer.submit('withdraw', account.phone_number, amount, idempotency_key=idempotency_key)
+        return then(future, lambda error: self._undo_if_rejected(error, account, amount, future.replayed))
+
+    @staticmethod
+    def _undo_if_rejected(error, account: MobileMoneyAccount, correction: Money, replayed: bool = False) -> None:
+        # a replay means another writer already applied this key, so the optimistic in-memory change is a duplicate
+        if error is not None or replayed:
+            account.balance += correction
+            account_cache.invalidate(account.phone_number)
+
+    def calculate_interest(self, account: SavingsAccount) -> Money:
+        return account.calculate_interest()
+
+    @timed('controller.repay_loan')
+    def repay_loan(self, account: LoanAccount, amount: float, idempotency_key: str = None) -> bool:
+        amount = Money.from_taka(amount)
+        future = self.idempotency.run(idempotency_key,
+                                      lambda: completed_future(self._repay_loan(account, amount, idempotency_key)),
+                                      account.phone_number)
+        return future.result()
+
+    def _repay_loan(self, account: LoanAccount, amount: Money, idempotency_key: str) -> bool:
+        return self.apply_update(account, lambda a: a.repay_loan(amount), idempotency_key, 'repay_loan')
+
+    @timed('controller.apply_update')
+    def apply_update(self, account: MobileMoneyAccount, operation, idempotency_key: str = None,
+                     operation_name: str = 'update_account') -> bool:
+        # optimistic concurrency: apply operation in memory, compare-and-swap on version, reload and redo on conflict.
+        # An idempotency key is stored in the same transaction as the successful swap. An operation that returns
+        # False rejected the change and left the account alone, so nothing is written
+        for attempt in range(self.max_update_retries):
+            if operation(account) is False:
+                return False
+            written = update_account_in_db(account.phone_number, account.balance,
+                                           getattr(account, 'loan_amount', None), account.name,
+                                           expected_version=account.version, idempotency_key=idempotency_key,
+                                           operation=operation_name)
+            if written is None:
+                # another front-end committed this key first; its change stands, so drop ours and take the row
+                self._reload(account)
+                return True
+            if written:
+                account.version += 1
+                return True
+            self.update_retries += 1
+            self._reload(account)
+            time.sleep(random.uniform(0, 0.0005 * 2 ** attempt))
+        self.update_conflicts += 1
+        print("Update failed because the account was changed concurrently. Please try again.")
+        return False
+
+    @staticmethod
+    def _reload(account: MobileMoneyAccount) -> None:
+        account_data = get_account_from_db(account.phone_number)
+        if account_data:
+            account.balance = Money(account_data['balance'])
+            if isinstance(account, LoanAccount):
+                account.loan_amount = Money(account_data['loan_amount'] or 0)
+            account.version = account_data['version']
+
+    @timed('controller.loan_schedule')
+    def loan_schedule(self, account: LoanAccount) -> tuple:
+        return loan_schedule(account.phone_number)
+
+    @timed('controller.next_installment')
+    def next_installment(self, account: LoanAccount) -> Money:
+        # the schedule maths runs on taka floats; only its result comes back as exact money
+        loan = get_loan_from_db(account.phone_number)
+        if loan is None:
+            return Money(0)
+        return Money.from_taka(next_installment(Money(loan['principal']).taka, loan['annual_rate'], loan['term_months'],
+                                                loan['start_ts'], Money(loan['loan_amount'] or 0).taka))
+
+    @timed('controller.claim_insurance')
+    def claim_insurance(self, account: InsuranceAccount, claim_amount: float, claim_ref: str = None,
+                        idempotency_key: str = None) -> Future:
+        claim_amount = Money.from_taka(claim_amount)
+        return self.idempotency.run(idempotency_key,
+                                    lambda: self._claim_insurance(account, claim_amount, claim_ref, idempotency_key),
+                                    account.phone_number)
+
+    def _claim_insurance(self, account: InsuranceAccount, claim_amount: Money, claim_ref: str,
+                         idempotency_key: str) -> Future:
+        future = self.ledger_writer.submit('claim', account.policy_number, claim_amount, claim_ref,
+                                           account.phone_number, idempotency_key=idempotency_key,
+                                           shard=db_pool.shard_of(account.phone_number))
+        return then(future, lambda error: self._apply_claim_result(error, account, claim_amount, future.replayed))
+
+    @staticmethod
+    def _apply_claim_result(error, account: InsuranceAccount, claim_amount: Money, replayed: bool = False) -> None:
+        if error is not None:
+            print(error)
+            return
+        if replayed:
+            return
+        account.balance += claim_amount
+        account.claim_insurance(claim_amount)
+
+    @timed('controller.statement_page')
+    def statement_page(self, account: MobileMoneyAccount, cursor=None, limit: int = 50, newer: bool = False) -> list:
+        return get_statement_page(account.phone_number, cursor, limit, newer)
+
+    @timed('controller.find_account')
+    def find_account(self, phone_number: str):
+        return account_directory.lookup(phone_number)
+
+    @timed('controller.transfer')
+    def transfer(self, source_account: MobileMoneyAccount, target_account, amount: float,
+                 idempotency_key: str = None) -> Future:
+        amount = Money.from_taka(amount)
+        return self.idempotency.run(idempotency_key,
+                                    lambda: self._transfer(source_account, target_account, amount, idempotency_key),
+                                    source_account.phone_number)
+
+    def _transfer(self, source_account: MobileMoneyAccount, target_account, amount: Money,
+                  idempotency_key: str) -> Future:
+        if amount <= 0:
+            return completed_future("Invalid transfer amount.")
+        error = self.velocity.admit(source_account.phone_number, source_account.account_type, amount)
+        if error is not None:
+            return completed_future(error)
+        future = self.ledger_writer.submit('transfer', source_account.phone_number, target_account.phone_number, amount,
+                                           idempotency_key=idempotency_key)
+        return then(future, lambda error: self._apply_transfer_result(error, source_account, target_account, amount,
+                                                                      future.replayed))
+
+    @staticmethod
+    def _apply_transfer_result(error, source_account: MobileMoneyAccount, target_account, amount: Money,
+                               replayed: bool = False) -> None:
+        if error is not None:
+            print(error)
+            return
+        if replayed:
+            return
+        source_account.balance -= amount
+        # the target may be a bare AccountHandle; only a loaded account object has a balance to update
+        loaded_target = account_cache.peek(target_account.phone_number)
+        if loaded_target is not None:
+            loaded_target.balance += amount
+        print(f"Transferred {amount} Tk/= from {source_account.phone_number} to {target_account.phone_number}")
+
+    @timed('controller.transfer_many')
+    def transfer_many(self, batch: list, chunk_size: int = 1000) -> list:
+        batch = [(source, target, Money.from_taka(amount)) for source, target, amount in batch]
+        failures = transfer_many_in_db(batch, chunk_size)
+        loaded = self.mobile_banking_system.accounts
+        touched = {phone_number for source, target, _ in batch for phone_number in (source, target)}
+        for phone_number in touched:
+            account = loaded.peek(phone_number)
+            if account is not None:
+                account_data = get_account_from_db(phone_number)
+                if account_data:
+                    account.balance = Money(account_data['balance'])
+                    account.version = account_data['version']
+        print(f"Applied {len(batch) - len(failures)} of {len(batch)} transfers.")
+        return failures
+
+
+class AccountManager:
+    def __init__(self):
+        self.accounts = {}
+        self.table = AccountTable()
+
+    def add_account(self, account: MobileMoneyAccount) -> None:
+        self.accounts[account.phone_number] = account
+
+    def display_all_accounts(self) -> None:
+        for phone_number, account in self.accounts.items():
+            print(f"Phone Number: {phone_number}")
+            if account.name:
+                print(f"Name: {account.name}")
+            print(f"Balance: {account.balance}")
+            print("------------------------")
+
+    def load_table(self) -> AccountTable:
+        self.table = AccountTable.from_db()
+        return self.table
+
+    def total(self, column: str = 'balances', account_type: str = None):
+        # money columns are int64 poisha and sum exactly; rates are floats
+        values = self.table.column(column)
+        exact = values.typecode == 'q'
+        if account_type is not None:
+            values = compress(values, self.table.type_mask(account_type))
+        return Money(sum(values)) if exact else math.fsum(values)
+
+    def totals_by_type(self, column: str = 'balances') -> dict:
+        return {account_type: self.total(column, account_type) for account_type in ACCOUNT_TYPES}
+
+    def filter(self, account_type: str = None, min_balance: float = None, max_balance: float = None) -> list:
+        rows = range(len(self.table))
+        if account_type is not None:
+            rows = compress(rows, self.table.type_mask(account_type))
+        if min_balance is not None or max_balance is not None:
+            low = float('-inf') if min_balance is None else Money.from_taka(min_balance)
+            high = float('inf') if max_balance is None else Money.from_taka(max_balance)
+            balances = self.table.balances
+            rows = (row for row in rows if low <= balances[row] <= high)
+        return [self.table.phone_numbers[row] for row in rows]
+
+    def top_n(self, n: int, column: str = 'balances', account_type: str = None) -> list:
+        values = self.table.column(column)
+        if values.typecode == 'q':
+            values = map(Money, values)
+        phone_numbers = self.table.phone_numbers
+        if account_type is not None:
+            mask = list(self.table.type_mask(account_type))
+            values = compress(values, mask)
+            phone_numbers = compress(phone_numbers, mask)
+        return heapq.nlargest(n, zip(values, phone_numbers))
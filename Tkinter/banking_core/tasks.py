@@ -0,0 +1,112 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from tkinter import messagebox
+
+from .metrics import metrics
+
+
+class Task:
+    def __init__(self, key, fn, args, on_success, on_error):
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.on_success = on_success
+        self.on_error = on_error
+        self.cancelled = False
+        self.submitted = time.perf_counter()
+
+    def cancel(self) -> None:
+        # a queued task is skipped; a running one finishes but its callbacks are dropped
+        self.cancelled = True
+
+
+class TaskExecutor:
+    def __init__(self, root, max_workers: int = 4, poll_interval: int = 50, on_busy_change=None):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.on_busy_change = on_busy_change
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gui-task')
+        self._results = queue.Queue()
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args, on_success=None, on_error=None) -> Task:
+        # tasks sharing a key (an account's phone number) run one at a time, in submission order
+        task = Task(key, fn, args, on_success, on_error)
+        with self._lock:
+            # the head of each deque is the task currently running for that key
+            tasks = self._queues.get(key)
+            if tasks is None:
+                self._queues[key] = deque([task])
+                self._executor.submit(self._run, task)
+            else:
+                tasks.append(task)
+        self.pending += 1
+        if self.pending == 1:
+            self._busy_changed(True)
+            self.root.after(self.poll_interval, self._poll)
+        return task
+
+    def cancel_all(self, key=None) -> None:
+        with self._lock:
+            queues = self._queues.values() if key is None else [self._queues.get(key, ())]
+            for tasks in queues:
+                for task in tasks:
+                    task.cancel()
+
+    def _run(self, task: Task) -> None:
+        while task is not None:
+            if task.cancelled:
+                self._results.put((task, None, None))
+            else:
+                try:
+                    result = task.fn(*task.args)
+                    if isinstance(result, Future):
+                        # controller money operations hand back a ledger future; report once it is durable
+                        result = result.result()
+                    self._results.put((task, result, None))
+                except Exception as e:
+                    self._results.put((task, None, e))
+            with self._lock:
+                tasks = self._queues[task.key]
+                tasks.popleft()
+                if tasks:
+                    task = tasks[0]
+                else:
+                    del self._queues[task.key]
+                    task = None
+
+    def _poll(self) -> None:
+        while True:
+            try:
+                task, result, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending -= 1
+            if task.cancelled:
+                continue
+            # submit to result on the Tk thread: what the user waits for, without the dialogs shown afterwards
+            metrics.observe('gui.task', time.perf_counter() - task.submitted, error is not None)
+            if error is not None:
+                if task.on_error is not None:
+                    task.on_error(error)
+                else:
+                    messagebox.showerror("Error", str(error))
+            elif task.on_success is not None:
+                task.on_success(result)
+        if self.pending:
+            self.root.after(self.poll_interval, self._poll)
+        else:
+            self._busy_changed(False)
+
+    def _busy_changed(self, busy: bool) -> None:
+        if self.on_busy_change is not None:
+            self.on_busy_change(busy)
+
+    def shutdown(self) -> None:
+        self.cancel_all()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,110 @@
+import threading
+import time
+from array import array
+from collections import namedtuple
+
+from .money import Money
+
+VelocityLimit = namedtuple('VelocityLimit', ['window', 'max_count', 'max_amount'])
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+DEFAULT_VELOCITY_LIMITS = {
+    'mobile': (VelocityLimit(MINUTE, 5, 25000), VelocityLimit(HOUR, 20, 50000), VelocityLimit(DAY, 50, 100000)),
+    'savings': (VelocityLimit(MINUTE, 5, 50000), VelocityLimit(HOUR, 20, 200000), VelocityLimit(DAY, 50, 500000)),
+    'loan': (VelocityLimit(MINUTE, 3, 10000), VelocityLimit(HOUR, 10, 25000), VelocityLimit(DAY, 20, 50000)),
+    'insurance': (VelocityLimit(MINUTE, 3, 10000), VelocityLimit(HOUR, 10, 25000), VelocityLimit(DAY, 20, 50000)),
+}
+
+
+class VelocityWindow:
+    __slots__ = ('times', 'amounts', 'total', 'tails', 'sums')
+
+    def __init__(self, capacity: int, windows: int):
+        # ring buffer of the newest events; every window fits because it can never hold more than its count limit
+        self.times = array('d', bytes(8 * capacity))
+        self.amounts = array('q', bytes(8 * capacity))
+        self.total = 0
+        self.tails = [0] * windows
+        self.sums = [0] * windows
+
+
+class VelocityTracker:
+    def __init__(self, limits: dict = None, sweep_every: int = 10000):
+        # account types missing from limits are not checked; max_amount is given in taka and kept as Money
+        limits = DEFAULT_VELOCITY_LIMITS if limits is None else limits
+        self.limits = {account_type: tuple(VelocityLimit(limit.window, limit.max_count, Money.from_taka(limit.max_amount))
+                                           for limit in type_limits)
+                       for account_type, type_limits in limits.items()}
+        self.capacities = {account_type: max(limit.max_count for limit in type_limits)
+                           for account_type, type_limits in self.limits.items() if type_limits}
+        self.horizon = max((limit.window for type_limits in self.limits.values() for limit in type_limits), default=0)
+        self.sweep_every = sweep_every
+        self.rejections = 0
+        self._accounts = {}
+        self._admitted = 0
+        self._lock = threading.Lock()
+
+    def admit(self, phone_number: str, account_type: str, amount: Money, now: float = None):
+        # counts attempts, not just successes, so a burst of failing guesses is throttled as well. Only positive
+        # amounts are admitted: a negative one would lower the running sums and open room for more
+        if amount <= 0:
+            return "Invalid amount."
+        limits = self.limits.get(account_type)
+        if not limits:
+            return None
+        now = time.time() if now is None else now
+        with self._lock:
+            state = self._accounts.get(phone_number)
+            if state is None:
+                state = self._accounts[phone_number] = VelocityWindow(self.capacities[account_type], len(limits))
+            capacity = len(state.times)
+            times, amounts, tails, sums = state.times, state.amounts, state.tails, state.sums
+            for i, limit in enumerate(limits):
+                # slide this window's tail past expired events; each event is dropped once per window
+                tail, horizon = tails[i], now - limit.window
+                while tail < state.total and times[tail % capacity] <= horizon:
+                    sums[i] -= amounts[tail % capacity]
+                    tail += 1
+                tails[i] = tail
+                if state.total - tail >= limit.max_count or sums[i] + amount > limit.max_amount:
+                    self.rejections += 1
+                    return (f"Velocity limit reached: at most {limit.max_count} operations or "
+                            f"{limit.max_amount} Tk/= per {_describe(limit.window)}.")
+            slot = state.total % capacity
+            times[slot] = now
+            amounts[slot] = amount
+            state.total += 1
+            for i in range(len(limits)):
+                sums[i] += amount
+            self._admitted += 1
+            if self._admitted % self.sweep_every == 0:
+                self._sweep(now)
+        return None
+
+    def _sweep(self, now: float) -> None:
+        # forget accounts whose newest event has left every window
+        for phone_number, state in list(self._accounts.items()):
+            newest = state.times[(state.total - 1) % len(state.times)]
+            if now - newest > self.horizon:
+                del self._accounts[phone_number]
+
+    def reset(self, phone_number: str = None) -> None:
+        with self._lock:
+            if phone_number is None:
+                self._accounts.clear()
+            else:
+                self._accounts.pop(phone_number, None)
+
+    def __len__(self) -> int:
+        return len(self._accounts)
+
+
+def _describe(window: int) -> str:
+    for size, unit in ((DAY, 'day'), (HOUR, 'hour'), (MINUTE, 'minute')):
+        if window % size == 0:
+            count = window // size
+            return unit if count == 1 else f"{count} {unit}s"
+    return f"{window} seconds"